@@ -0,0 +1,5 @@
+import time
+
+# Recorded before any service module is imported so the server can report how long
+# loading the application (FastAPI, Prisma's generated client, services) took.
+IMPORT_STARTED = time.perf_counter()
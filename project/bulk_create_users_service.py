@@ -0,0 +1,352 @@
+import asyncio
+import csv
+import json
+import multiprocessing
+import os
+import uuid
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import (
+    AsyncIterable,
+    AsyncIterator,
+    Deque,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+)
+
+import bcrypt
+import prisma
+import prisma.models
+from pydantic import BaseModel, ValidationError
+
+BULK_IMPORT_BATCH_SIZE = int(os.getenv("BULK_IMPORT_BATCH_SIZE", "500"))
+
+BULK_IMPORT_MAX_LINE_BYTES = int(os.getenv("BULK_IMPORT_MAX_LINE_BYTES", "65536"))
+
+# Every uvicorn worker gets its own pool, so by default the cores are split between them.
+BULK_IMPORT_HASH_WORKERS = int(
+    os.getenv(
+        "BULK_IMPORT_HASH_WORKERS",
+        str(max(1, (os.cpu_count() or 1) // int(os.getenv("WEB_CONCURRENCY", "1")))),
+    )
+)
+
+
+class BulkUserRow(BaseModel):
+    """
+    A single account to be created, as read from one NDJSON object or CSV row.
+    """
+
+    email: str
+    password: str
+    first_name: Optional[str] = None
+    last_name: Optional[str] = None
+
+
+class BulkUserRowStatus(BaseModel):
+    """
+    The outcome of importing one row of the uploaded file, streamed back as soon as its batch completes.
+    """
+
+    row: int
+    success: bool
+    message: str
+    email: Optional[str] = None
+    user_id: Optional[str] = None
+
+
+_hash_pool: Optional[ProcessPoolExecutor] = None
+
+
+def _get_hash_pool() -> ProcessPoolExecutor:
+    global _hash_pool
+    if _hash_pool is None:
+        # Forking a server worker would copy its event loop, threads and database engine into
+        # every hashing process; forkserver starts them from a clean interpreter instead.
+        _hash_pool = ProcessPoolExecutor(
+            max_workers=BULK_IMPORT_HASH_WORKERS,
+            mp_context=multiprocessing.get_context("forkserver"),
+        )
+    return _hash_pool
+
+
+def shutdown_hash_pool() -> None:
+    """
+    Stops the password hashing worker processes, if they were started.
+    """
+    global _hash_pool
+    if _hash_pool is not None:
+        _hash_pool.shutdown(cancel_futures=True)
+        _hash_pool = None
+
+
+def hash_passwords(passwords: List[str]) -> List[str]:
+    """
+    Hashes a chunk of passwords with bcrypt. Runs inside a worker process.
+
+    Args:
+        passwords (List[str]): The plaintext passwords to hash.
+
+    Returns:
+        List[str]: The bcrypt hashes, in the same order as the input.
+    """
+    return [
+        bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt()).decode("utf-8")
+        for password in passwords
+    ]
+
+
+async def hash_passwords_in_pool(passwords: List[str]) -> List[str]:
+    """
+    Spreads bcrypt hashing of a batch of passwords across this worker's BULK_IMPORT_HASH_WORKERS processes.
+
+    Args:
+        passwords (List[str]): The plaintext passwords to hash.
+
+    Returns:
+        List[str]: The bcrypt hashes, in the same order as the input.
+    """
+    loop = asyncio.get_running_loop()
+    chunk_size = max(1, -(-len(passwords) // BULK_IMPORT_HASH_WORKERS))
+    chunks = [
+        passwords[i : i + chunk_size] for i in range(0, len(passwords), chunk_size)
+    ]
+    results = await asyncio.gather(
+        *(loop.run_in_executor(_get_hash_pool(), hash_passwords, c) for c in chunks)
+    )
+    return [hashed for chunk in results for hashed in chunk]
+
+
+class _LineFeed:
+    """
+    The lines a csv.reader reads from. It is refilled with one complete record at a time, so a
+    single reader can parse a CSV upload that arrives asynchronously.
+    """
+
+    def __init__(self) -> None:
+        self.lines: Deque[str] = deque()
+
+    def __iter__(self) -> "_LineFeed":
+        return self
+
+    def __next__(self) -> str:
+        if not self.lines:
+            raise StopIteration
+        return self.lines.popleft()
+
+
+def _decode_line(line: bytes) -> str | ValueError:
+    if len(line) > BULK_IMPORT_MAX_LINE_BYTES:
+        return ValueError(f"Line is longer than {BULK_IMPORT_MAX_LINE_BYTES} bytes.")
+    try:
+        return line.decode("utf-8").rstrip("\r")
+    except UnicodeDecodeError as e:
+        return e
+
+
+async def _iter_lines(chunks: AsyncIterable[bytes]) -> AsyncIterator[str | ValueError]:
+    # A line that cannot be read is yielded as the error explaining why, so that only its row
+    # fails. Over-long lines are dropped as they arrive instead of being buffered.
+    buffer = b""
+    skipping = False
+    async for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            if skipping:
+                skipping = False
+                continue
+            yield _decode_line(line)
+        if len(buffer) > BULK_IMPORT_MAX_LINE_BYTES:
+            if not skipping:
+                yield _decode_line(buffer)
+            skipping = True
+            buffer = b""
+    if buffer and not skipping:
+        yield _decode_line(buffer)
+
+
+def _parse_csv_record(
+    reader: Iterator[List[str]], feed: _LineFeed, record: List[str]
+) -> List[str]:
+    feed.lines.extend(f"{line}\n" for line in record)
+    try:
+        fields = next(reader)
+    except StopIteration:
+        fields = []
+    if feed.lines:
+        feed.lines.clear()
+        raise ValueError("Row has unbalanced quotes.")
+    return fields
+
+
+async def _iter_rows(
+    chunks: AsyncIterable[bytes], content_type: str
+) -> AsyncIterator[Tuple[int, BulkUserRow | BulkUserRowStatus]]:
+    is_csv = "csv" in content_type
+    feed = _LineFeed()
+    reader = csv.reader(feed)
+    header: Optional[List[str]] = None
+    record: List[str] = []
+    record_size = 0
+    quotes = 0
+    row = 0
+    async for line in _iter_lines(chunks):
+        if isinstance(line, str):
+            if not record and not line.strip():
+                continue
+            if is_csv:
+                # A quoted field may contain newlines, so a CSV record ends at the first line
+                # break outside quotes, i.e. once its quotes are balanced.
+                record.append(line)
+                record_size += len(line)
+                quotes += line.count('"')
+                if quotes % 2 and record_size <= BULK_IMPORT_MAX_LINE_BYTES:
+                    continue
+        try:
+            if is_csv and header is None and isinstance(line, str) and not quotes % 2:
+                header = [
+                    name.strip() for name in _parse_csv_record(reader, feed, record)
+                ]
+                continue
+            row += 1
+            if isinstance(line, ValueError):
+                raise line
+            if is_csv:
+                if quotes % 2:
+                    raise ValueError(
+                        f"Row is longer than {BULK_IMPORT_MAX_LINE_BYTES} bytes."
+                    )
+                values = _parse_csv_record(reader, feed, record)
+                if len(values) > len(header):
+                    raise ValueError(
+                        f"Row has {len(values)} fields but the header has {len(header)}."
+                    )
+                fields = dict(zip(header, values))
+                yield row, BulkUserRow(**{k: v or None for k, v in fields.items()})
+            else:
+                yield row, BulkUserRow(**json.loads(line))
+        except (ValueError, TypeError, ValidationError, csv.Error) as e:
+            yield row, BulkUserRowStatus(
+                row=row, success=False, message=f"Invalid row: {str(e)}"
+            )
+        finally:
+            record, record_size, quotes = [], 0, 0
+    if record:
+        row += 1
+        yield row, BulkUserRowStatus(
+            row=row, success=False, message="Invalid row: Unterminated quoted field."
+        )
+
+
+async def _import_batch(
+    batch: Dict[int, BulkUserRow],
+) -> List[BulkUserRowStatus]:
+    statuses: List[BulkUserRowStatus] = []
+    existing = await prisma.models.User.prisma().find_many(
+        where={"email": {"in": [user.email for user in batch.values()]}}
+    )
+    taken = {user.email for user in existing}
+    to_create: Dict[int, BulkUserRow] = {}
+    for row, user in batch.items():
+        if user.email in taken:
+            statuses.append(
+                BulkUserRowStatus(
+                    row=row,
+                    success=False,
+                    message="Email already exists.",
+                    email=user.email,
+                )
+            )
+            continue
+        taken.add(user.email)
+        to_create[row] = user
+    if not to_create:
+        return statuses
+    hashed_passwords = await hash_passwords_in_pool(
+        [user.password for user in to_create.values()]
+    )
+    user_ids = {row: str(uuid.uuid4()) for row in to_create}
+    try:
+        async with prisma.get_client().tx() as tx:
+            await prisma.models.User.prisma(tx).create_many(
+                data=[
+                    {
+                        "id": user_ids[row],
+                        "email": user.email,
+                        "hashedPassword": hashed,
+                    }
+                    for (row, user), hashed in zip(to_create.items(), hashed_passwords)
+                ]
+            )
+            await prisma.models.Profile.prisma(tx).create_many(
+                data=[
+                    {
+                        "userId": user_ids[row],
+                        "firstName": user.first_name,
+                        "lastName": user.last_name,
+                    }
+                    for row, user in to_create.items()
+                ]
+            )
+    except Exception as e:
+        statuses.extend(
+            BulkUserRowStatus(
+                row=row,
+                success=False,
+                message=f"Failed to create user account: {str(e)}",
+                email=user.email,
+            )
+            for row, user in to_create.items()
+        )
+        return sorted(statuses, key=lambda status: status.row)
+    statuses.extend(
+        BulkUserRowStatus(
+            row=row,
+            success=True,
+            message="User account created successfully.",
+            email=user.email,
+            user_id=user_ids[row],
+        )
+        for row, user in to_create.items()
+    )
+    return sorted(statuses, key=lambda status: status.row)
+
+
+async def bulk_create_users(
+    chunks: AsyncIterable[bytes], content_type: str
+) -> AsyncIterator[BulkUserRowStatus]:
+    """
+    Creates user accounts from an NDJSON or CSV upload, streaming a status for every row.
+
+    The upload is consumed incrementally and processed in batches of BULK_IMPORT_BATCH_SIZE rows,
+    so memory use does not depend on the size of the file; lines longer than
+    BULK_IMPORT_MAX_LINE_BYTES, or that are not valid UTF-8, fail only their own row. Passwords of
+    each batch are hashed in a pool of BULK_IMPORT_HASH_WORKERS processes per server worker, and
+    the User and Profile rows are inserted with create_many inside a single transaction per batch.
+    CSV fields may be quoted to contain commas, quotes and newlines.
+
+    Args:
+        chunks (AsyncIterable[bytes]): The raw request body as it arrives.
+        content_type (str): The request content type. CSV is used when it mentions "csv", NDJSON otherwise.
+            CSV uploads need a header row naming the email, password, first_name and last_name columns.
+
+    Yields:
+        BulkUserRowStatus: The outcome for each row, numbered from 1 in upload order.
+    """
+    batch: Dict[int, BulkUserRow] = {}
+    async for row, item in _iter_rows(chunks, content_type):
+        if isinstance(item, BulkUserRowStatus):
+            yield item
+            continue
+        batch[row] = item
+        if len(batch) >= BULK_IMPORT_BATCH_SIZE:
+            for status in await _import_batch(batch):
+                yield status
+            batch = {}
+    if batch:
+        for status in await _import_batch(batch):
+            yield status
@@ -3,6 +3,7 @@ from typing import Optional
 
 import prisma
 import prisma.models
+import project.list_styles_service
 from pydantic import BaseModel
 
 
@@ -49,6 +50,7 @@ async def create_style(
     new_style = await prisma.models.Style.prisma().create(
         data={"name": name, "description": description}
     )
+    project.list_styles_service.invalidate_styles_cache()
     style_with_created_at = await prisma.models.Style.prisma().find_unique(
         where={"id": new_style.id}, include={"createdAt": True}
     )
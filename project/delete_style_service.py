@@ -1,5 +1,6 @@
 import prisma
 import prisma.models
+import project.list_styles_service
 from pydantic import BaseModel
 
 
@@ -32,6 +33,7 @@ async def delete_style(id: str) -> DeleteStyleResponse:
         if style is None:
             return DeleteStyleResponse(success=False, message="Style not found.")
         await prisma.models.Style.prisma().delete(where={"id": id})
+        project.list_styles_service.invalidate_styles_cache()
         return DeleteStyleResponse(success=True, message="Style deleted successfully.")
     except Exception as e:
         return DeleteStyleResponse(
@@ -0,0 +1,251 @@
+import asyncio
+import json
+import logging
+import os
+import urllib.parse
+import urllib.request
+import zipfile
+import zlib
+from typing import AsyncIterator, Dict, List, Literal, Optional, Set, Tuple
+
+import prisma
+import prisma.models
+from pydantic import BaseModel
+
+logger = logging.getLogger(__name__)
+
+EXPORT_CHUNK_SIZE = int(os.getenv("EXPORT_CHUNK_SIZE", "500"))
+
+EXPORT_IMAGE_TIMEOUT_SECONDS = float(os.getenv("EXPORT_IMAGE_TIMEOUT_SECONDS", "30"))
+
+EXPORT_IMAGE_HOSTS = {
+    host.strip().lower()
+    for host in os.getenv("EXPORT_IMAGE_HOSTS", "example.com").split(",")
+    if host.strip()
+}
+
+ExportFormat = Literal["ndjson", "gzip", "zip"]
+
+EXPORT_FORMATS: Dict[str, Tuple[str, str]] = {
+    "ndjson": ("application/x-ndjson", "ndjson"),
+    "gzip": ("application/gzip", "ndjson.gz"),
+    "zip": ("application/zip", "zip"),
+}
+
+# The exported tables, with the relation fields left out of each record.
+EXPORT_TABLES: List[Tuple[str, Set[str]]] = [
+    ("TextInput", {"User", "Style", "GeneratedImage", "ImageRequestLog"}),
+    ("GeneratedImage", {"User", "TextInput", "ModeratedImage"}),
+    ("ImageRequestLog", {"User", "TextInput"}),
+    ("FeedbackSubmission", {"User"}),
+]
+
+_IMAGE_READ_SIZE = 64 * 1024
+
+
+async def ensure_user_exists(user_id: str) -> None:
+    """
+    Checks that a user exists before an export of their data is started.
+
+    Args:
+        user_id (str): The unique identifier of the user.
+
+    Raises:
+        ValueError: If there is no user with that id.
+    """
+    user = await prisma.models.User.prisma().find_unique(where={"id": user_id})
+    if user is None:
+        raise ValueError(f"User {user_id} not found.")
+
+
+async def iter_table(table: str, user_id: str) -> AsyncIterator[BaseModel]:
+    """
+    Reads all of a user's records from one table in id order, EXPORT_CHUNK_SIZE at a time.
+
+    Each chunk resumes after the last id of the previous one, so no more than one chunk is
+    held in memory and later chunks do not get slower the way OFFSET pagination would.
+
+    Args:
+        table (str): The name of the Prisma model to read.
+        user_id (str): The unique identifier of the user.
+
+    Yields:
+        BaseModel: The user's records, one at a time.
+    """
+    actions = getattr(prisma.models, table).prisma()
+    last_id: Optional[str] = None
+    while True:
+        where = {"userId": user_id}
+        if last_id is not None:
+            where["id"] = {"gt": last_id}
+        records = await actions.find_many(
+            where=where, order={"id": "asc"}, take=EXPORT_CHUNK_SIZE
+        )
+        for record in records:
+            yield record
+        if len(records) < EXPORT_CHUNK_SIZE:
+            return
+        last_id = records[-1].id
+
+
+async def iter_records(user_id: str) -> AsyncIterator[bytes]:
+    """
+    Streams every exported record of a user as NDJSON lines tagged with their table.
+
+    Args:
+        user_id (str): The unique identifier of the user.
+
+    Yields:
+        bytes: One chunk of NDJSON lines per database chunk read.
+    """
+    for table, relations in EXPORT_TABLES:
+        lines: List[str] = []
+        async for record in iter_table(table, user_id):
+            data = record.model_dump(mode="json", exclude=relations)
+            lines.append(json.dumps({"table": table, "record": data}) + "\n")
+            if len(lines) >= EXPORT_CHUNK_SIZE:
+                yield "".join(lines).encode("utf-8")
+                lines = []
+        if lines:
+            yield "".join(lines).encode("utf-8")
+
+
+async def iter_gzip(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    """
+    Gzip-compresses a byte stream incrementally.
+
+    Args:
+        chunks (AsyncIterator[bytes]): The uncompressed stream.
+
+    Yields:
+        bytes: The gzip stream.
+    """
+    compressor = zlib.compressobj(wbits=zlib.MAX_WBITS | 16)
+    async for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+class _ZipStream:
+    """
+    A write-only file object that hands whatever zipfile wrote so far back to the caller.
+    """
+
+    def __init__(self):
+        self._parts: List[bytes] = []
+
+    def write(self, data: bytes) -> int:
+        self._parts.append(bytes(data))
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._parts)
+        self._parts = []
+        return data
+
+
+def check_image_url(url: str) -> None:
+    """
+    Makes sure an image URL points at one of the EXPORT_IMAGE_HOSTS over http(s).
+
+    Args:
+        url (str): The URL to check.
+
+    Raises:
+        ValueError: If the URL uses another scheme or host.
+    """
+    parsed = urllib.parse.urlsplit(url)
+    if parsed.scheme not in ("http", "https"):
+        raise ValueError(f"Refusing to fetch image with scheme '{parsed.scheme}'.")
+    if (parsed.hostname or "").lower() not in EXPORT_IMAGE_HOSTS:
+        raise ValueError(f"Refusing to fetch image from host '{parsed.hostname}'.")
+
+
+class _CheckedRedirectHandler(urllib.request.HTTPRedirectHandler):
+    """
+    Follows redirects only to URLs that pass check_image_url.
+    """
+
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        check_image_url(newurl)
+        return super().redirect_request(req, fp, code, msg, headers, newurl)
+
+
+_image_opener = urllib.request.build_opener(_CheckedRedirectHandler)
+
+
+def _open_image(url: str):
+    check_image_url(url)
+    return _image_opener.open(url, timeout=EXPORT_IMAGE_TIMEOUT_SECONDS)
+
+
+async def iter_zip(user_id: str) -> AsyncIterator[bytes]:
+    """
+    Streams a zip bundle with the user's records and the blobs of their generated images.
+
+    The bundle holds records.ndjson followed by images/<id><extension> for every generated image.
+    Images are only fetched over http(s) from EXPORT_IMAGE_HOSTS. An image that cannot be
+    downloaded is replaced by images/<id>.error.txt describing why.
+
+    Args:
+        user_id (str): The unique identifier of the user.
+
+    Yields:
+        bytes: The zip stream.
+    """
+    stream = _ZipStream()
+    with zipfile.ZipFile(stream, mode="w", compression=zipfile.ZIP_DEFLATED) as bundle:
+        with bundle.open("records.ndjson", mode="w", force_zip64=True) as entry:
+            async for chunk in iter_records(user_id):
+                entry.write(chunk)
+                yield stream.drain()
+        async for image in iter_table("GeneratedImage", user_id):
+            extension = os.path.splitext(image.imageUrl.split("?", 1)[0])[1] or ".bin"
+            try:
+                response = await asyncio.to_thread(_open_image, image.imageUrl)
+            except Exception as e:
+                logger.warning("Could not export image %s: %s", image.id, e)
+                bundle.writestr(f"images/{image.id}.error.txt", str(e))
+                yield stream.drain()
+                continue
+            try:
+                with bundle.open(
+                    f"images/{image.id}{extension}", mode="w", force_zip64=True
+                ) as entry:
+                    while True:
+                        block = await asyncio.to_thread(response.read, _IMAGE_READ_SIZE)
+                        if not block:
+                            break
+                        entry.write(block)
+                        yield stream.drain()
+            finally:
+                response.close()
+            yield stream.drain()
+    yield stream.drain()
+
+
+def export_user_data(user_id: str, format: ExportFormat) -> AsyncIterator[bytes]:
+    """
+    Streams a full export of a user's text inputs, generated images, request logs and feedback.
+
+    Records are read table by table in keyset-ordered chunks and written out as they arrive,
+    so memory use stays constant however large the user's history is.
+
+    Args:
+        user_id (str): The unique identifier of the user.
+        format (ExportFormat): "ndjson", "gzip" for gzip-compressed NDJSON, or "zip" for a bundle that
+            also contains the image blobs.
+
+    Returns:
+        AsyncIterator[bytes]: The export stream.
+    """
+    if format == "zip":
+        return iter_zip(user_id)
+    if format == "gzip":
+        return iter_gzip(iter_records(user_id))
+    return iter_records(user_id)
@@ -1,8 +1,13 @@
+import asyncio
 from datetime import datetime
 from typing import Optional
 
 import prisma
 import prisma.models
+import project.generation_events_service
+import project.generation_router_service
+import project.list_styles_service
+import project.profile_cache_service
 from pydantic import BaseModel
 
 
@@ -22,45 +27,113 @@ async def generate_image(
     text_description: str,
     style: Optional[str] = None,
     language: Optional[str] = None,
+    generation_id: Optional[str] = None,
 ) -> GenerateImageResponse:
     """
     Processes user input text and returns a URL to the generated image.
 
-    This is a simplified version of the function that simulates the process of generating an image based on text,
-    without actually calling an external API. This function logs the generation request to the database and returns
-    a simulated image URL and metadata.
+    This function logs the generation request to the database, has the image rendered by the best available
+    generation backend and returns its URL and metadata.
 
     Args:
         user_id (str): The unique identifier of the user making the request.
         text_description (str): The textual description provided by the user that will be the basis for the image generation.
         style (Optional[str]): Optional. The preferred style or theme for the generated image.
-        language (Optional[str]): Optional. The language of the input text. Defaults to English if not specified.
+            Defaults to the style named by the user's preferred theme, if there is one.
+        language (Optional[str]): Optional. The language of the input text. Defaults to the user's preferred language.
+        generation_id (Optional[str]): Optional. An id issued to the user by issue_generation_id, under which queued,
+            started, progress and done events are published for streaming to the client.
 
     Returns:
         GenerateImageResponse: The output model after generating an image with a link to the generated image and any relevant metadata.
     """
-    await log_image_generation_request(user_id, text_description, style, language)
-    generated_image = await prisma.models.GeneratedImage.prisma().create(
-        data={
-            "imageUrl": "https://example.com/generated_image.jpg",
-            "userId": user_id,
-            "TextInput": {
-                "create": {
-                    "inputText": text_description,
-                    "userId": user_id,
-                    "styleId": style,
-                }
-            },
-            "createdAt": datetime.now(),
-        }
-    )
-    return GenerateImageResponse(
-        image_url=generated_image.imageUrl,
-        generation_time=generated_image.createdAt,
-        feedback_prompt="Please share your feedback on this image.",
+    report_progress(generation_id, "queued")
+    try:
+        if style is None or language is None:
+            profile = await project.profile_cache_service.get_user_profile(user_id)
+            if profile is not None:
+                language = language or profile.language
+                if style is None and profile.theme:
+                    style = await resolve_theme_style(profile.theme)
+        report_progress(generation_id, "started")
+        await log_image_generation_request(user_id, text_description, style, language)
+        report_progress(generation_id, "progress", 0.25)
+        result = await project.generation_router_service.router.generate(
+            text_description, style, language
+        )
+        report_progress(generation_id, "progress", 0.75)
+        generated_image = await prisma.models.GeneratedImage.prisma().create(
+            data={
+                "imageUrl": result.image_url,
+                "userId": user_id,
+                "TextInput": {
+                    "create": {
+                        "inputText": text_description,
+                        "userId": user_id,
+                        "styleId": style,
+                    }
+                },
+                "createdAt": datetime.now(),
+            }
+        )
+        response = GenerateImageResponse(
+            image_url=generated_image.imageUrl,
+            generation_time=generated_image.createdAt,
+            feedback_prompt="Please share your feedback on this image.",
+        )
+    except asyncio.CancelledError:
+        report_progress(
+            generation_id, "error", data={"error": "Generation was cancelled."}
+        )
+        raise
+    except Exception as e:
+        report_progress(generation_id, "error", data={"error": str(e)})
+        raise
+    report_progress(generation_id, "done", 1.0, response.model_dump(mode="json"))
+    return response
+
+
+def report_progress(
+    generation_id: Optional[str],
+    event: str,
+    progress: float = 0.0,
+    data: Optional[dict] = None,
+) -> None:
+    """
+    Publishes a progress event for a generation, if the client asked to follow it.
+
+    Args:
+        generation_id (Optional[str]): The issued generation id, or None if nobody is following the generation.
+        event (str): One of "queued", "started", "progress", "done" or "error".
+        progress (float): The fraction of the work completed, from 0 to 1.
+        data (Optional[dict]): The generated image for "done" events, or the failure for "error" events.
+    """
+    if generation_id is None:
+        return
+    project.generation_events_service.publish(
+        project.generation_events_service.GenerationEvent(
+            generation_id=generation_id, event=event, progress=progress, data=data
+        )
     )
 
 
+async def resolve_theme_style(theme: str) -> Optional[str]:
+    """
+    Maps a user's preferred theme onto the id of the style with the same name, using the cached style catalog.
+
+    Args:
+        theme (str): The theme stored in the user's preferences.
+
+    Returns:
+        Optional[str]: The id of the matching style, or None if no style has that name.
+    """
+    catalog = await project.list_styles_service.list_styles()
+    for candidate in catalog.styles:
+        if candidate.name.lower() == theme.lower():
+            return candidate.id
+    return None
+
+
 async def log_image_generation_request(
     user_id: str, description: str, style: Optional[str], language: Optional[str]
 ):
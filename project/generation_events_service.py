@@ -0,0 +1,271 @@
+import asyncio
+import os
+import secrets
+import time
+from typing import Any, AsyncIterator, Dict, Literal, Optional, Set, Tuple
+
+import project.shared_cache_service
+from pydantic import BaseModel
+
+GENERATION_EVENTS_BUFFER_SIZE = int(os.getenv("GENERATION_EVENTS_BUFFER_SIZE", "16"))
+
+GENERATION_EVENTS_RETAIN_SECONDS = float(
+    os.getenv("GENERATION_EVENTS_RETAIN_SECONDS", "60")
+)
+
+GENERATION_EVENTS_STALE_SECONDS = float(
+    os.getenv("GENERATION_EVENTS_STALE_SECONDS", "600")
+)
+
+GENERATION_EVENTS_KEEPALIVE_SECONDS = float(
+    os.getenv("GENERATION_EVENTS_KEEPALIVE_SECONDS", "15")
+)
+
+GENERATION_EVENTS_IDLE_SECONDS = float(
+    os.getenv("GENERATION_EVENTS_IDLE_SECONDS", "120")
+)
+
+GENERATION_EVENTS_POLL_SECONDS = float(
+    os.getenv("GENERATION_EVENTS_POLL_SECONDS", "0.25")
+)
+
+GENERATION_EVENTS_FIRST_EVENT_SECONDS = float(
+    os.getenv("GENERATION_EVENTS_FIRST_EVENT_SECONDS", "30")
+)
+
+GENERATION_ID_TTL_SECONDS = float(os.getenv("GENERATION_ID_TTL_SECONDS", "3600"))
+
+TERMINAL_EVENTS = ("done", "error")
+
+
+class GenerationEvent(BaseModel):
+    """
+    A progress update for a single image generation.
+    """
+
+    generation_id: str
+    event: Literal["queued", "started", "progress", "done", "error"]
+    progress: float = 0.0
+    data: Optional[Dict[str, Any]] = None
+
+
+class GenerationIdResponse(BaseModel):
+    """
+    A generation id issued to a user, to pass to POST /generate-image and the event streams.
+    """
+
+    generation_id: str
+
+
+_subscribers: Dict[str, Set["asyncio.Queue[GenerationEvent]"]] = {}
+
+_latest: Dict[str, Tuple[float, GenerationEvent]] = {}
+
+
+def _shared_key(generation_id: str) -> str:
+    return f"generation-event:{generation_id}"
+
+
+def _owner_key(generation_id: str) -> str:
+    return f"generation-owner:{generation_id}"
+
+
+def _offer(queue: "asyncio.Queue[GenerationEvent]", event: GenerationEvent) -> None:
+    # A subscriber that is not keeping up loses its oldest undelivered updates rather than
+    # holding up the publisher or buffering without bound. Progress is cumulative, so the
+    # newest event always carries everything the client needs.
+    while queue.full():
+        queue.get_nowait()
+    queue.put_nowait(event)
+
+
+def _prune(now: float) -> None:
+    # Finished generations are kept briefly for late subscribers; unfinished ones are dropped
+    # once nothing has been published for them in a long while, e.g. after a cancellation.
+    expired = [
+        generation_id
+        for generation_id, (published_at, event) in _latest.items()
+        if now - published_at
+        > (
+            GENERATION_EVENTS_RETAIN_SECONDS
+            if event.event in TERMINAL_EVENTS
+            else GENERATION_EVENTS_STALE_SECONDS
+        )
+    ]
+    for generation_id in expired:
+        del _latest[generation_id]
+
+
+def publish(event: GenerationEvent) -> None:
+    """
+    Delivers an event to every current subscriber of its generation without blocking.
+
+    The latest event of each generation is retained, so a client that subscribes after the
+    generation has started (or finished, for GENERATION_EVENTS_RETAIN_SECONDS) still gets
+    its current state. It is also written to the shared cache, so subscribers connected to
+    another worker on the same host can follow the generation.
+
+    Args:
+        event (GenerationEvent): The progress update to publish.
+    """
+    now = time.monotonic()
+    _prune(now)
+    _latest[event.generation_id] = (now, event)
+    project.shared_cache_service.set(
+        _shared_key(event.generation_id),
+        event.model_dump_json().encode("utf-8"),
+        GENERATION_EVENTS_RETAIN_SECONDS
+        if event.event in TERMINAL_EVENTS
+        else GENERATION_EVENTS_STALE_SECONDS,
+    )
+    for queue in _subscribers.get(event.generation_id, ()):
+        _offer(queue, event)
+
+
+def issue_generation_id(user_id: str) -> GenerationIdResponse:
+    """
+    Issues an unguessable generation id that only the given user may generate images under.
+
+    Knowing the id is what lets a client follow the generation, so ids are never chosen by
+    clients. The owner is kept in the shared cache for GENERATION_ID_TTL_SECONDS, which makes
+    the id usable on every worker of this host.
+
+    Args:
+        user_id (str): The user who will request the generation.
+
+    Returns:
+        GenerationIdResponse: The newly issued generation id.
+    """
+    generation_id = secrets.token_urlsafe(24)
+    project.shared_cache_service.set(
+        _owner_key(generation_id), user_id.encode("utf-8"), GENERATION_ID_TTL_SECONDS
+    )
+    return GenerationIdResponse(generation_id=generation_id)
+
+
+def generation_id_owner(generation_id: str) -> Optional[str]:
+    """
+    Looks up the user a generation id was issued to.
+
+    Args:
+        generation_id (str): An id returned by issue_generation_id.
+
+    Returns:
+        Optional[str]: The owning user's id, or None if the id was not issued or has expired.
+    """
+    owner = project.shared_cache_service.get(_owner_key(generation_id))
+    return owner.decode("utf-8") if owner is not None else None
+
+
+def is_known(generation_id: str) -> bool:
+    """
+    Tells whether any event has been published for a generation on this host.
+
+    Args:
+        generation_id (str): An id returned by issue_generation_id.
+
+    Returns:
+        bool: True if the generation has a retained event in this worker or the shared cache.
+    """
+    return (
+        generation_id in _latest
+        or project.shared_cache_service.get(_shared_key(generation_id)) is not None
+    )
+
+
+async def _follow_local(
+    generation_id: str,
+) -> AsyncIterator[Optional[GenerationEvent]]:
+    queue: "asyncio.Queue[GenerationEvent]" = asyncio.Queue(
+        maxsize=GENERATION_EVENTS_BUFFER_SIZE
+    )
+    _subscribers.setdefault(generation_id, set()).add(queue)
+    try:
+        _offer(queue, _latest[generation_id][1])
+        idle_since = time.monotonic()
+        while time.monotonic() - idle_since < GENERATION_EVENTS_IDLE_SECONDS:
+            try:
+                event = await asyncio.wait_for(
+                    queue.get(), timeout=GENERATION_EVENTS_KEEPALIVE_SECONDS
+                )
+            except asyncio.TimeoutError:
+                yield None
+                continue
+            idle_since = time.monotonic()
+            yield event
+            if event.event in TERMINAL_EVENTS:
+                return
+    finally:
+        subscribers = _subscribers.get(generation_id)
+        if subscribers is not None:
+            subscribers.discard(queue)
+            if not subscribers:
+                del _subscribers[generation_id]
+
+
+async def _follow_shared(
+    generation_id: str,
+) -> AsyncIterator[Optional[GenerationEvent]]:
+    last: Optional[bytes] = None
+    idle_since = keepalive_at = time.monotonic()
+    while time.monotonic() - idle_since < GENERATION_EVENTS_IDLE_SECONDS:
+        current = project.shared_cache_service.get(_shared_key(generation_id))
+        if current is None:
+            return
+        if current != last:
+            last = current
+            idle_since = keepalive_at = time.monotonic()
+            event = GenerationEvent.model_validate_json(current)
+            yield event
+            if event.event in TERMINAL_EVENTS:
+                return
+        elif time.monotonic() - keepalive_at >= GENERATION_EVENTS_KEEPALIVE_SECONDS:
+            keepalive_at = time.monotonic()
+            yield None
+        await asyncio.sleep(GENERATION_EVENTS_POLL_SECONDS)
+
+
+async def _await_first_event(generation_id: str) -> bool:
+    # Clients open the stream alongside the generation request, so the first event may
+    # still be on its way; the shared cache also sees events of this worker.
+    deadline = time.monotonic() + GENERATION_EVENTS_FIRST_EVENT_SECONDS
+    while not is_known(generation_id):
+        if time.monotonic() >= deadline or generation_id_owner(generation_id) is None:
+            return False
+        await asyncio.sleep(GENERATION_EVENTS_POLL_SECONDS)
+    return True
+
+
+async def subscribe(generation_id: str) -> AsyncIterator[Optional[GenerationEvent]]:
+    """
+    Streams the events of a generation until it is done, has failed, or goes quiet.
+
+    A generation running in this worker is followed through a queue of at most
+    GENERATION_EVENTS_BUFFER_SIZE events. One running in another worker on the same host is
+    followed by polling the shared cache every GENERATION_EVENTS_POLL_SECONDS. Generations on
+    other hosts cannot be seen, so the streaming endpoints need sticky routing per host.
+    For an issued id without events yet the stream waits up to
+    GENERATION_EVENTS_FIRST_EVENT_SECONDS for the generation to start, so clients can subscribe
+    before or while sending the generation request. The stream ends at once for ids that were
+    never issued, and after GENERATION_EVENTS_IDLE_SECONDS without a new event.
+
+    Args:
+        generation_id (str): An id returned by issue_generation_id.
+
+    Yields:
+        Optional[GenerationEvent]: The generation's events in publish order, starting with its
+            latest one, and None as a keepalive every GENERATION_EVENTS_KEEPALIVE_SECONDS
+            without events.
+    """
+    _prune(time.monotonic())
+    if not await _await_first_event(generation_id):
+        return
+    if generation_id in _latest:
+        follow = _follow_local(generation_id)
+    else:
+        follow = _follow_shared(generation_id)
+    try:
+        async for event in follow:
+            yield event
+    finally:
+        await follow.aclose()
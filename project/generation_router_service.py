@@ -0,0 +1,357 @@
+import asyncio
+import math
+import os
+import random
+import time
+import uuid
+from collections import deque
+from typing import Callable, Deque, Dict, List, Optional, Protocol, Tuple
+
+from pydantic import BaseModel
+
+GENERATION_BACKENDS = os.getenv("GENERATION_BACKENDS", "placeholder:placeholder")
+
+GENERATION_HEDGING = os.getenv("GENERATION_HEDGING", "true").lower() == "true"
+
+GENERATION_STATS_WINDOW = int(os.getenv("GENERATION_STATS_WINDOW", "100"))
+
+GENERATION_STATS_MIN_SAMPLES = int(os.getenv("GENERATION_STATS_MIN_SAMPLES", "20"))
+
+GENERATION_BREAKER_ERROR_RATE = float(
+    os.getenv("GENERATION_BREAKER_ERROR_RATE", "0.5")
+)
+
+GENERATION_BREAKER_COOLDOWN_SECONDS = float(
+    os.getenv("GENERATION_BREAKER_COOLDOWN_SECONDS", "30")
+)
+
+
+class GenerationResult(BaseModel):
+    """
+    The image produced by a generation backend.
+    """
+
+    image_url: str
+    backend: str
+
+
+class BackendStatus(BaseModel):
+    """
+    The rolling health of a generation backend.
+    """
+
+    name: str
+    circuit: str
+    samples: int
+    error_rate: float
+    p95_latency: Optional[float] = None
+
+
+class GenerationBackend(Protocol):
+    """
+    An image generation service the router can send requests to.
+    """
+
+    name: str
+
+    async def generate(
+        self, text_description: str, style: Optional[str], language: Optional[str]
+    ) -> str:
+        """
+        Generates an image and returns its URL.
+        """
+        ...
+
+
+class PlaceholderGenerationBackend:
+    """
+    Answers immediately with a fixed placeholder image, until a real generation service is configured.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+
+    async def generate(
+        self, text_description: str, style: Optional[str], language: Optional[str]
+    ) -> str:
+        """
+        Returns the placeholder image URL.
+
+        Args:
+            text_description (str): The textual description to render.
+            style (Optional[str]): The id of the style to apply.
+            language (Optional[str]): The language of the description.
+
+        Returns:
+            str: The URL of the placeholder image.
+        """
+        return "https://example.com/generated_image.jpg"
+
+
+class FakeGenerationBackend:
+    """
+    A local stand-in for an image generation service for testing, with configurable latency and failure rate.
+    """
+
+    def __init__(self, name: str, latency: float, error_rate: float):
+        self.name = name
+        self.latency = latency
+        self.error_rate = error_rate
+
+    async def generate(
+        self, text_description: str, style: Optional[str], language: Optional[str]
+    ) -> str:
+        """
+        Simulates generating an image.
+
+        Args:
+            text_description (str): The textual description to render.
+            style (Optional[str]): The id of the style to apply.
+            language (Optional[str]): The language of the description.
+
+        Returns:
+            str: The URL of the generated image.
+        """
+        await asyncio.sleep(random.expovariate(1 / self.latency) if self.latency else 0)
+        if random.random() < self.error_rate:
+            raise Exception(f"Backend {self.name} failed to generate the image")
+        return f"https://example.com/{self.name}/{uuid.uuid4()}.jpg"
+
+
+class CircuitBreaker:
+    """
+    Tracks rolling latency and error rate of a backend and takes it out of rotation when unhealthy.
+
+    The circuit opens once the error rate over the last GENERATION_STATS_WINDOW calls reaches
+    GENERATION_BREAKER_ERROR_RATE. After GENERATION_BREAKER_COOLDOWN_SECONDS it half-opens and
+    lets a single probe call through; its outcome decides whether the circuit closes again or
+    re-opens for another cooldown.
+    """
+
+    def __init__(self):
+        self.samples: Deque[Tuple[float, bool]] = deque(maxlen=GENERATION_STATS_WINDOW)
+        self.state = "closed"
+        self.open_until = 0.0
+        self.probing = False
+
+    def record(self, latency: float, ok: bool) -> None:
+        self.probing = False
+        if self.state == "half-open":
+            self.samples.clear()
+            if ok:
+                self.state = "closed"
+            else:
+                self._open()
+        self.samples.append((latency, ok))
+        if (
+            self.state == "closed"
+            and len(self.samples) >= GENERATION_STATS_MIN_SAMPLES
+            and self.error_rate() >= GENERATION_BREAKER_ERROR_RATE
+        ):
+            self._open()
+
+    def _open(self) -> None:
+        self.state = "open"
+        self.open_until = time.monotonic() + GENERATION_BREAKER_COOLDOWN_SECONDS
+
+    def available(self) -> bool:
+        if self.state == "open" and time.monotonic() >= self.open_until:
+            self.state = "half-open"
+        if self.state == "half-open":
+            return not self.probing
+        return self.state == "closed"
+
+    def acquire(self) -> bool:
+        """
+        Claims permission for one call, taking the single probe slot when half-open.
+        """
+        if not self.available():
+            return False
+        if self.state == "half-open":
+            self.probing = True
+        return True
+
+    def release(self) -> None:
+        """
+        Gives back the probe slot of a call that ended without an outcome, e.g. a cancelled hedge.
+        """
+        self.probing = False
+
+    def error_rate(self) -> float:
+        if not self.samples:
+            return 0.0
+        return sum(1 for _, ok in self.samples if not ok) / len(self.samples)
+
+    def p95_latency(self) -> Optional[float]:
+        latencies = sorted(latency for latency, ok in self.samples if ok)
+        if len(latencies) < GENERATION_STATS_MIN_SAMPLES:
+            return None
+        return latencies[math.ceil(0.95 * len(latencies)) - 1]
+
+
+class GenerationRouter:
+    """
+    Spreads image generation across several backends, preferring the healthiest and fastest.
+    """
+
+    def __init__(self, backends: List[GenerationBackend], hedging: bool):
+        self.backends = backends
+        self.hedging = hedging
+        self.breakers: Dict[str, CircuitBreaker] = {
+            backend.name: CircuitBreaker() for backend in backends
+        }
+
+    def _candidates(self) -> List[GenerationBackend]:
+        available = [b for b in self.backends if self.breakers[b.name].available()]
+        # Fastest p95 first; backends without enough history follow in configured order.
+        return sorted(
+            available,
+            key=lambda b: self.breakers[b.name].p95_latency() or math.inf,
+        )
+
+    async def _call(
+        self,
+        backend: GenerationBackend,
+        text_description: str,
+        style: Optional[str],
+        language: Optional[str],
+    ) -> GenerationResult:
+        started = time.monotonic()
+        try:
+            image_url = await backend.generate(text_description, style, language)
+        except asyncio.CancelledError:
+            self.breakers[backend.name].release()
+            raise
+        except Exception:
+            self.breakers[backend.name].record(time.monotonic() - started, False)
+            raise
+        self.breakers[backend.name].record(time.monotonic() - started, True)
+        return GenerationResult(image_url=image_url, backend=backend.name)
+
+    async def generate(
+        self,
+        text_description: str,
+        style: Optional[str] = None,
+        language: Optional[str] = None,
+    ) -> GenerationResult:
+        """
+        Generates an image on the best available backend.
+
+        If the first backend has not answered within its rolling p95 latency and hedging is
+        enabled, the same request is also sent to the next backend. Whichever answers first
+        wins and the other call is cancelled. A backend that fails is followed by the next one.
+
+        Args:
+            text_description (str): The textual description to render.
+            style (Optional[str]): The id of the style to apply.
+            language (Optional[str]): The language of the description.
+
+        Returns:
+            GenerationResult: The generated image and the backend that produced it.
+
+        Raises:
+            Exception: If no backend is available or all attempted backends failed.
+        """
+        remaining = self._candidates()
+        pending: Dict["asyncio.Task[GenerationResult]", GenerationBackend] = {}
+        hedged = False
+        last_error: Optional[BaseException] = None
+
+        def launch() -> Optional[float]:
+            while remaining:
+                backend = remaining.pop(0)
+                if not self.breakers[backend.name].acquire():
+                    continue
+                task = asyncio.create_task(
+                    self._call(backend, text_description, style, language)
+                )
+                pending[task] = backend
+                return self.breakers[backend.name].p95_latency()
+            return None
+
+        hedge_after = launch()
+        if not pending:
+            raise Exception("No image generation backend is currently available")
+        try:
+            while pending:
+                timeout = None
+                if self.hedging and not hedged and remaining:
+                    timeout = hedge_after
+                done, _ = await asyncio.wait(
+                    pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    hedged = True
+                    launch()
+                    continue
+                # Every finished task is collected, so a failure that finished alongside
+                # the winner is still retrieved rather than reported as never retrieved.
+                result: Optional[GenerationResult] = None
+                for task in done:
+                    del pending[task]
+                    if task.exception() is not None:
+                        last_error = task.exception()
+                    elif result is None:
+                        result = task.result()
+                if result is not None:
+                    return result
+                if not pending and remaining:
+                    hedge_after = launch()
+            raise last_error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def status(self) -> List[BackendStatus]:
+        """
+        Reports the rolling health of every backend.
+
+        Returns:
+            List[BackendStatus]: One entry per configured backend.
+        """
+        statuses = []
+        for backend in self.backends:
+            breaker = self.breakers[backend.name]
+            breaker.available()
+            statuses.append(
+                BackendStatus(
+                    name=backend.name,
+                    circuit=breaker.state,
+                    samples=len(breaker.samples),
+                    error_rate=breaker.error_rate(),
+                    p95_latency=breaker.p95_latency(),
+                )
+            )
+        return statuses
+
+
+# Backend kinds that can be named in GENERATION_BACKENDS, each built from "kind:name:args...".
+# A real generation service plugs in by adding its kind here.
+BACKEND_KINDS: Dict[str, Callable[..., GenerationBackend]] = {
+    "placeholder": PlaceholderGenerationBackend,
+    "fake": lambda name, latency, error_rate: FakeGenerationBackend(
+        name, float(latency), float(error_rate)
+    ),
+}
+
+
+def build_router(config: str, hedging: bool) -> GenerationRouter:
+    """
+    Builds a router from a comma-separated list of kind:name[:args] backend definitions.
+
+    Args:
+        config (str): The backend definitions, e.g. "placeholder:main" or, for testing,
+            "fake:fake-a:0.2:0.0,fake:fake-b:0.3:0.05" (name, mean latency, error rate).
+        hedging (bool): Whether slow requests are hedged onto a second backend.
+
+    Returns:
+        GenerationRouter: The configured router.
+    """
+    backends = []
+    for definition in config.split(","):
+        kind, *args = definition.strip().split(":")
+        backends.append(BACKEND_KINDS[kind](*args))
+    return GenerationRouter(backends, hedging)
+
+
+router = build_router(GENERATION_BACKENDS, GENERATION_HEDGING)
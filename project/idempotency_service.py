@@ -0,0 +1,285 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple, Type, TypeVar
+
+import prisma
+import prisma.errors
+import prisma.models
+import project.shared_cache_service
+from pydantic import BaseModel
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_TTL_SECONDS = int(os.getenv("IDEMPOTENCY_TTL_SECONDS", "86400"))
+
+IDEMPOTENCY_PENDING_SECONDS = float(os.getenv("IDEMPOTENCY_PENDING_SECONDS", "120"))
+
+IDEMPOTENCY_POLL_SECONDS = float(os.getenv("IDEMPOTENCY_POLL_SECONDS", "0.2"))
+
+IDEMPOTENCY_PURGE_INTERVAL_SECONDS = float(
+    os.getenv("IDEMPOTENCY_PURGE_INTERVAL_SECONDS", "3600")
+)
+
+ResponseModel = TypeVar("ResponseModel", bound=BaseModel)
+
+_in_flight: Dict[str, Tuple[str, "asyncio.Future[BaseModel]"]] = {}
+
+_purged_at: Optional[float] = None
+
+_purge_task: Optional["asyncio.Task[None]"] = None
+
+
+class IdempotencyKeyMismatchError(ValueError):
+    """
+    Raised when an Idempotency-Key is reused for a request with different parameters.
+    """
+
+
+class IdempotencyKeyInProgressError(Exception):
+    """
+    Raised when the original request for an Idempotency-Key is still running after a retry gave up waiting.
+    """
+
+
+def request_hash(params: Dict[str, Any]) -> str:
+    """
+    Fingerprints the parameters of a request so a reused key with a different payload can be rejected.
+
+    Args:
+        params (Dict[str, Any]): The request parameters.
+
+    Returns:
+        str: A SHA-256 hex digest of the parameters.
+    """
+    encoded = json.dumps(params, sort_keys=True, default=str).encode("utf-8")
+    return hashlib.sha256(encoded).hexdigest()
+
+
+def succeeded(response: BaseModel) -> bool:
+    """
+    The default test for whether a response may be replayed: anything but an explicit success=False.
+
+    Args:
+        response (BaseModel): The handler's response.
+
+    Returns:
+        bool: True if the response should be stored for retries.
+    """
+    return getattr(response, "success", True) is not False
+
+
+def _check_hash(key: str, stored_hash: str, incoming_hash: str) -> None:
+    if stored_hash != incoming_hash:
+        raise IdempotencyKeyMismatchError(
+            f"Idempotency-Key '{key}' was already used with different request parameters."
+        )
+
+
+def _remember(record_key: str, hashed: str, response: BaseModel) -> None:
+    project.shared_cache_service.set(
+        f"idempotency:{record_key}",
+        f"{hashed}:{response.model_dump_json()}".encode("utf-8"),
+        IDEMPOTENCY_TTL_SECONDS,
+    )
+
+
+def _recall(
+    record_key: str, response_model: Type[ResponseModel]
+) -> Optional[Tuple[str, ResponseModel]]:
+    cached = project.shared_cache_service.get(f"idempotency:{record_key}")
+    if cached is None:
+        return None
+    hashed, body = cached.decode("utf-8").split(":", 1)
+    return hashed, response_model.model_validate_json(body)
+
+
+async def _claim_or_wait(
+    key: str, record_key: str, hashed: str, response_model: Type[ResponseModel]
+) -> Optional[ResponseModel]:
+    """
+    Claims the key for this request, or waits for the request that already holds it.
+
+    Returns None once this request owns the claim and must run the handler, or the stored
+    response of the original request. A claim whose owner died is taken over once it expires.
+    """
+    actions = prisma.models.IdempotencyRecord.prisma()
+    deadline = time.monotonic() + IDEMPOTENCY_PENDING_SECONDS
+    while True:
+        now = datetime.now(timezone.utc)
+        try:
+            await actions.create(
+                data={
+                    "key": record_key,
+                    "requestHash": hashed,
+                    "expiresAt": now + timedelta(seconds=IDEMPOTENCY_PENDING_SECONDS),
+                }
+            )
+            return None
+        except prisma.errors.UniqueViolationError:
+            pass
+        record = await actions.find_unique(where={"key": record_key})
+        if record is None:
+            continue
+        _check_hash(key, record.requestHash, hashed)
+        if record.expiresAt <= now:
+            await actions.delete_many(
+                where={"key": record_key, "expiresAt": {"lte": now}}
+            )
+            continue
+        if record.responseBody is not None:
+            return response_model.model_validate_json(record.responseBody)
+        if time.monotonic() >= deadline:
+            raise IdempotencyKeyInProgressError(
+                f"The request for Idempotency-Key '{key}' is still in progress."
+            )
+        await asyncio.sleep(IDEMPOTENCY_POLL_SECONDS)
+
+
+async def _complete(record_key: str, response: BaseModel) -> None:
+    await prisma.models.IdempotencyRecord.prisma().update(
+        where={"key": record_key},
+        data={
+            "responseBody": response.model_dump_json(),
+            "expiresAt": datetime.now(timezone.utc)
+            + timedelta(seconds=IDEMPOTENCY_TTL_SECONDS),
+        },
+    )
+
+
+async def _release(record_key: str) -> None:
+    try:
+        await prisma.models.IdempotencyRecord.prisma().delete_many(
+            where={"key": record_key, "responseBody": None}
+        )
+    except Exception:
+        logger.exception("Failed to release idempotency claim %s", record_key)
+
+
+async def purge_expired_records() -> int:
+    """
+    Deletes stored idempotency records whose TTL has passed.
+
+    Returns:
+        int: The number of records deleted.
+    """
+    global _purged_at
+    _purged_at = time.monotonic()
+    return await prisma.models.IdempotencyRecord.prisma().delete_many(
+        where={"expiresAt": {"lte": datetime.now(timezone.utc)}}
+    )
+
+
+async def _purge_quietly() -> None:
+    try:
+        await purge_expired_records()
+    except Exception:
+        logger.exception("Failed to purge expired idempotency records")
+
+
+def _purge_if_due() -> None:
+    # Expired rows are otherwise only purged at startup, so long-running workers take turns
+    # purging them in the background as keys are claimed.
+    global _purge_task
+    if _purged_at is not None and (
+        time.monotonic() - _purged_at < IDEMPOTENCY_PURGE_INTERVAL_SECONDS
+    ):
+        return
+    if _purge_task is None or _purge_task.done():
+        _purge_task = asyncio.get_running_loop().create_task(_purge_quietly())
+
+
+async def run_idempotent(
+    key: Optional[str],
+    scope: str,
+    params: Dict[str, Any],
+    response_model: Type[ResponseModel],
+    handler: Callable[[], Awaitable[ResponseModel]],
+    store_if: Callable[[ResponseModel], bool] = succeeded,
+) -> ResponseModel:
+    """
+    Runs a request handler at most once per Idempotency-Key, replaying its response for retries.
+
+    Before running the handler the request claims the key with a pending IdempotencyRecord row,
+    so a retry that lands on any worker waits for the original result instead of running the
+    handler again. Completed responses are then replayed from the cache shared by all workers
+    on the host, or from the IdempotencyRecord table, for IDEMPOTENCY_TTL_SECONDS. Failures are
+    not recorded: when the handler raises, is cancelled or store_if rejects its response, the
+    claim is released and a retry runs the handler again. Expired records are purged in the
+    background every IDEMPOTENCY_PURGE_INTERVAL_SECONDS.
+
+    Args:
+        key (Optional[str]): The client's Idempotency-Key header. Without one the handler simply runs.
+        scope (str): The endpoint the key belongs to, e.g. "POST /user".
+        params (Dict[str, Any]): The request parameters, used to reject a key reused for a different request.
+        response_model (Type[ResponseModel]): The model used to decode a stored response.
+        handler (Callable[[], Awaitable[ResponseModel]]): Performs the actual request.
+        store_if (Callable[[ResponseModel], bool]): Decides whether a response may be replayed.
+            Defaults to rejecting responses with success=False.
+
+    Returns:
+        ResponseModel: The response of the original request for this key.
+
+    Raises:
+        IdempotencyKeyMismatchError: If the key was already used with different request parameters.
+        IdempotencyKeyInProgressError: If the original request is still running after IDEMPOTENCY_PENDING_SECONDS.
+    """
+    if key is None:
+        return await handler()
+    record_key = f"{scope}:{key}"
+    hashed = request_hash(params)
+
+    recent = _recall(record_key, response_model)
+    if recent is not None:
+        stored_hash, response = recent
+        _check_hash(key, stored_hash, hashed)
+        return response
+
+    while record_key in _in_flight:
+        stored_hash, future = _in_flight[record_key]
+        _check_hash(key, stored_hash, hashed)
+        try:
+            return await asyncio.shield(future)
+        except asyncio.CancelledError:
+            # When the original request was cancelled, this retry takes over the key.
+            if not future.cancelled() or asyncio.current_task().cancelling():
+                raise
+
+    _purge_if_due()
+    future: "asyncio.Future[BaseModel]" = asyncio.get_running_loop().create_future()
+    _in_flight[record_key] = (hashed, future)
+    try:
+        response = await _claim_or_wait(key, record_key, hashed, response_model)
+        if response is None:
+            try:
+                response = await handler()
+            except BaseException:
+                await _release(record_key)
+                raise
+            if store_if(response):
+                try:
+                    await _complete(record_key, response)
+                except Exception:
+                    logger.exception("Failed to store idempotency record %s", record_key)
+                _remember(record_key, hashed, response)
+            else:
+                await _release(record_key)
+        else:
+            _remember(record_key, hashed, response)
+        future.set_result(response)
+        return response
+    except asyncio.CancelledError:
+        future.cancel()
+        raise
+    except Exception as e:
+        future.set_exception(e)
+        # Mark the exception as retrieved; waiting retries, if any, re-raise it themselves.
+        future.exception()
+        raise
+    finally:
+        if _in_flight.get(record_key, (None, None))[1] is future:
+            del _in_flight[record_key]
@@ -1,7 +1,9 @@
+import os
 from typing import List
 
 import prisma
 import prisma.models
+import project.shared_cache_service
 from pydantic import BaseModel
 
 
@@ -23,6 +25,39 @@ class ListStylesResponse(BaseModel):
     styles: List[StyleModel]
 
 
+STYLES_CACHE_TTL_SECONDS = float(os.getenv("STYLES_CACHE_TTL_SECONDS", "300"))
+
+STYLES_CACHE_KEY = "styles"
+
+
+async def load_styles() -> ListStylesResponse:
+    """
+    Reads the full style catalog from the database and stores it in the shared cache.
+
+    Returns:
+        ListStylesResponse: The freshly loaded style catalog.
+    """
+    style_records = await prisma.models.Style.prisma().find_many()
+    styles = [
+        StyleModel(id=style.id, name=style.name, description=style.description or "")
+        for style in style_records
+    ]
+    catalog = ListStylesResponse(styles=styles)
+    project.shared_cache_service.set(
+        STYLES_CACHE_KEY,
+        catalog.model_dump_json().encode("utf-8"),
+        STYLES_CACHE_TTL_SECONDS,
+    )
+    return catalog
+
+
+def invalidate_styles_cache() -> None:
+    """
+    Drops the cached style catalog for every worker so the next read goes back to the database.
+    """
+    project.shared_cache_service.delete(STYLES_CACHE_KEY)
+
+
 async def list_styles() -> ListStylesResponse:
     """
     Retrieves a list of available styles.
@@ -33,12 +68,10 @@ async def list_styles() -> ListStylesResponse:
     Returns:
     ListStylesResponse: A response containing the list of styles available. Each style is represented by its name, description, and potentially an ID for deeper references.
 
-    Queries the database to retrieve all the styles available and formats the data
-    into a ListStylesResponse object containing a list of StyleModel objects.
+    Serves the catalog from the cache shared by all workers on the host, which is pre-loaded
+    during startup warmup and refreshed from the database whenever a style is created or deleted.
     """
-    style_records = await prisma.models.Style.prisma().find_many()
-    styles = [
-        StyleModel(id=style.id, name=style.name, description=style.description or "")
-        for style in style_records
-    ]
-    return ListStylesResponse(styles=styles)
+    cached = project.shared_cache_service.get(STYLES_CACHE_KEY)
+    if cached is not None:
+        return ListStylesResponse.model_validate_json(cached)
+    return await load_styles()
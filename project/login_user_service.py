@@ -1,8 +1,14 @@
+import os
+from typing import Optional
+
 import prisma
 import prisma.models
+import project.shared_cache_service
 from passlib.context import CryptContext
 from pydantic import BaseModel
 
+LOGIN_CACHE_TTL_SECONDS = float(os.getenv("LOGIN_CACHE_TTL_SECONDS", "300"))
+
 
 class LoginResponse(BaseModel):
     """
@@ -13,9 +19,57 @@ class LoginResponse(BaseModel):
     user_id: str
 
 
+class LoginCredentials(BaseModel):
+    """
+    The part of a user record needed to authenticate them, as kept in the shared cache.
+    """
+
+    user_id: str
+    hashed_password: str
+
+
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
 
+def _login_cache_key(email: str) -> str:
+    return f"login:{email}"
+
+
+def invalidate_login_credentials(email: str) -> None:
+    """
+    Drops the cached credentials for an email address, for every worker.
+
+    Args:
+        email (str): The email address whose credentials changed.
+    """
+    project.shared_cache_service.delete(_login_cache_key(email))
+
+
+async def get_login_credentials(email: str) -> Optional[LoginCredentials]:
+    """
+    Looks up the credentials for an email address, reading the database only on a shared cache miss.
+
+    Args:
+        email (str): The email address the user is logging in with.
+
+    Returns:
+        Optional[LoginCredentials]: The user's credentials, or None if no user has that email.
+    """
+    cached = project.shared_cache_service.get(_login_cache_key(email))
+    if cached is not None:
+        return LoginCredentials.model_validate_json(cached)
+    user = await prisma.models.User.prisma().find_unique(where={"email": email})
+    if user is None:
+        return None
+    credentials = LoginCredentials(user_id=user.id, hashed_password=user.hashedPassword)
+    project.shared_cache_service.set(
+        _login_cache_key(email),
+        credentials.model_dump_json().encode("utf-8"),
+        LOGIN_CACHE_TTL_SECONDS,
+    )
+    return credentials
+
+
 async def verify_password(plain_password: str, hashed_password: str) -> bool:
     """
     Verifies a password against a hashed version.
@@ -54,10 +108,10 @@ async def login_user(email: str, password: str) -> LoginResponse:
     Returns:
         LoginResponse: Response model for the user login process, primarily contains the session token for authenticated requests.
     """
-    user = await prisma.models.User.prisma().find_unique(where={"email": email})
-    if user is None:
+    credentials = await get_login_credentials(email)
+    if credentials is None:
         raise Exception("User not found, status_code=401")
-    if not await verify_password(password, user.hashedPassword):
+    if not await verify_password(password, credentials.hashed_password):
         raise Exception("Incorrect password, status_code=401")
-    token = await generate_token(user.id)
-    return LoginResponse(token=token, user_id=user.id)
+    token = await generate_token(credentials.user_id)
+    return LoginResponse(token=token, user_id=credentials.user_id)
@@ -0,0 +1,103 @@
+import os
+import time
+from typing import Optional
+
+import prisma
+import prisma.models
+import project.shared_cache_service
+from pydantic import BaseModel
+
+PROFILE_CACHE_TTL_SECONDS = float(os.getenv("PROFILE_CACHE_TTL_SECONDS", "300"))
+
+
+class CachedUserProfile(BaseModel):
+    """
+    A user's profile and preferences as kept in the shared cache.
+    """
+
+    user_id: str
+    email: str
+    first_name: Optional[str] = None
+    last_name: Optional[str] = None
+    theme: Optional[str] = None
+    language: str = "en"
+    loaded_at: float = 0.0
+
+
+def _profile_cache_key(user_id: str) -> str:
+    return f"profile:{user_id}"
+
+
+def _cached_profile(user_id: str) -> Optional[CachedUserProfile]:
+    cached = project.shared_cache_service.get(_profile_cache_key(user_id))
+    if cached is None:
+        return None
+    return CachedUserProfile.model_validate_json(cached)
+
+
+def store_user_profile(profile: CachedUserProfile) -> None:
+    """
+    Writes a freshly committed profile into the cache shared by all workers on the host.
+
+    Args:
+        profile (CachedUserProfile): The up-to-date profile of the user.
+    """
+    profile = profile.model_copy(update={"loaded_at": time.time()})
+    project.shared_cache_service.set(
+        _profile_cache_key(profile.user_id),
+        profile.model_dump_json().encode("utf-8"),
+        PROFILE_CACHE_TTL_SECONDS,
+    )
+
+
+def invalidate_user_profile(user_id: str) -> None:
+    """
+    Drops a user's cached profile for every worker so the next read goes back to the database.
+
+    Args:
+        user_id (str): The unique identifier of the user.
+    """
+    project.shared_cache_service.delete(_profile_cache_key(user_id))
+
+
+async def get_user_profile(user_id: str) -> Optional[CachedUserProfile]:
+    """
+    Returns a user's profile and preferences, reading the database only on a cache miss.
+
+    Entries expire after PROFILE_CACHE_TTL_SECONDS, which bounds how stale a profile can get
+    should an update's write-through ever be lost.
+
+    Args:
+        user_id (str): The unique identifier of the user.
+
+    Returns:
+        Optional[CachedUserProfile]: The user's profile, or None if the user does not exist.
+    """
+    profile = _cached_profile(user_id)
+    if profile is not None:
+        return profile
+    started_at = time.time()
+    user = await prisma.models.User.prisma().find_unique(
+        where={"id": user_id}, include={"Profile": True, "UserPreferences": True}
+    )
+    if user is None:
+        return None
+    preferences = user.UserPreferences[0] if user.UserPreferences else None
+    profile = CachedUserProfile(
+        user_id=user.id,
+        email=user.email,
+        first_name=user.Profile.firstName if user.Profile else None,
+        last_name=user.Profile.lastName if user.Profile else None,
+        theme=preferences.theme if preferences else None,
+        language=preferences.language if preferences else "en",
+        loaded_at=started_at,
+    )
+    # A profile update that was written through while this read was in flight wins over it.
+    current = _cached_profile(user_id)
+    if current is None or current.loaded_at < started_at:
+        project.shared_cache_service.set(
+            _profile_cache_key(user_id),
+            profile.model_dump_json().encode("utf-8"),
+            PROFILE_CACHE_TTL_SECONDS,
+        )
+    return profile
@@ -1,34 +1,64 @@
+import json
 import logging
+import time
 from contextlib import asynccontextmanager
-from typing import Optional
+from typing import List, Optional
 
 import project.api_generate_image_service
+import project.bulk_create_users_service
 import project.create_style_service
 import project.create_user_service
 import project.delete_style_service
+import project.export_user_data_service
 import project.generate_image_service
+import project.generation_events_service
+import project.generation_router_service
+import project.idempotency_service
 import project.list_styles_service
 import project.login_user_service
 import project.report_content_service
 import project.submit_feedback_service
 import project.update_user_profile_service
-from fastapi import FastAPI
+import project.warmup_service
+from fastapi import FastAPI, Header, Request, WebSocket, WebSocketDisconnect
 from fastapi.encoders import jsonable_encoder
-from fastapi.responses import Response
+from fastapi.responses import Response, StreamingResponse
 from prisma import Prisma
+from starlette.requests import ClientDisconnect
+from starlette.types import Receive, Scope, Send
 
 logger = logging.getLogger(__name__)
 
+IMPORT_SECONDS = time.perf_counter() - project.IMPORT_STARTED
+
 db_client = Prisma(auto_register=True)
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    await db_client.connect()
+    await project.warmup_service.run_warmup(db_client, IMPORT_SECONDS)
+    await project.idempotency_service.purge_expired_records()
     yield
+    project.warmup_service.report.ready = False
+    project.bulk_create_users_service.shutdown_hash_pool()
     await db_client.disconnect()
 
 
+class UploadStreamingResponse(StreamingResponse):
+    """
+    A streaming response whose body is produced while the request body is still being read.
+
+    StreamingResponse listens for a client disconnect while it streams, and that listener takes
+    the request body messages the response needs. Here a disconnect surfaces instead as
+    ClientDisconnect from request.stream().
+    """
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        await self.stream_response(send)
+        if self.background is not None:
+            await self.background()
+
+
 app = FastAPI(
     title="image maker",
     lifespan=lifespan,
@@ -109,16 +139,68 @@ async def api_get_list_styles() -> project.list_styles_service.ListStylesRespons
     response_model=project.generate_image_service.GenerateImageResponse,
 )
 async def api_post_generate_image(
-    user_id: str, text_description: str, style: Optional[str], language: Optional[str]
+    user_id: str,
+    text_description: str,
+    style: Optional[str] = None,
+    language: Optional[str] = None,
+    generation_id: Optional[str] = None,
+    idempotency_key: Optional[str] = Header(None),
 ) -> project.generate_image_service.GenerateImageResponse | Response:
     """
     Processes user input text and returns a URL to the generated image.
+
+    A missing or empty style or language falls back to the user's profile preferences.
+    Progress is published under generation_id, which must have been issued to the user by
+    POST /generate-image/ids.
     """
+    style = style or None
+    language = language or None
     try:
-        res = await project.generate_image_service.generate_image(
-            user_id, text_description, style, language
+        if generation_id is not None and (
+            project.generation_events_service.generation_id_owner(generation_id)
+            != user_id
+        ):
+            return Response(
+                content=json.dumps(
+                    {"error": "generation_id was not issued to this user."}
+                ),
+                status_code=403,
+                media_type="application/json",
+            )
+        res = await project.idempotency_service.run_idempotent(
+            idempotency_key,
+            "POST /generate-image",
+            {
+                "user_id": user_id,
+                "text_description": text_description,
+                "style": style,
+                "language": language,
+            },
+            project.generate_image_service.GenerateImageResponse,
+            lambda: project.generate_image_service.generate_image(
+                user_id, text_description, style, language, generation_id
+            ),
         )
+        if generation_id is not None and not (
+            project.generation_events_service.is_known(generation_id)
+        ):
+            # A replayed response never ran the generation, so nothing was published for this id.
+            project.generate_image_service.report_progress(
+                generation_id, "done", 1.0, res.model_dump(mode="json")
+            )
         return res
+    except project.idempotency_service.IdempotencyKeyMismatchError as e:
+        return Response(
+            content=json.dumps({"error": str(e)}),
+            status_code=422,
+            media_type="application/json",
+        )
+    except project.idempotency_service.IdempotencyKeyInProgressError as e:
+        return Response(
+            content=json.dumps({"error": str(e)}),
+            status_code=409,
+            media_type="application/json",
+        )
     except Exception as e:
         logger.exception("Error processing request")
         res = dict()
@@ -130,11 +212,105 @@ async def api_post_generate_image(
         )
 
 
+@app.post(
+    "/generate-image/ids",
+    response_model=project.generation_events_service.GenerationIdResponse,
+)
+async def api_post_generation_id(
+    user_id: str,
+) -> project.generation_events_service.GenerationIdResponse | Response:
+    """
+    Issues a generation id for following a generation of this user over /events or /ws.
+    """
+    try:
+        res = project.generation_events_service.issue_generation_id(user_id)
+        return res
+    except Exception as e:
+        logger.exception("Error processing request")
+        res = dict()
+        res["error"] = str(e)
+        return Response(
+            content=jsonable_encoder(res),
+            status_code=500,
+            media_type="application/json",
+        )
+
+
+@app.get(
+    "/generation/backends",
+    response_model=List[project.generation_router_service.BackendStatus],
+)
+async def api_get_generation_backends() -> (
+    List[project.generation_router_service.BackendStatus] | Response
+):
+    """
+    Reports the rolling latency, error rate and circuit state of each generation backend.
+    """
+    try:
+        res = project.generation_router_service.router.status()
+        return res
+    except Exception as e:
+        logger.exception("Error processing request")
+        res = dict()
+        res["error"] = str(e)
+        return Response(
+            content=jsonable_encoder(res),
+            status_code=500,
+            media_type="application/json",
+        )
+
+
+@app.get("/generate-image/{generation_id}/events", response_class=StreamingResponse)
+async def api_get_generation_events(generation_id: str) -> StreamingResponse:
+    """
+    Streams the progress of a generation as Server-Sent Events until it is done.
+
+    The id comes from POST /generate-image/ids, and the stream may be opened before the generation
+    request is sent. Generations are only visible to workers on the host that runs them, so this
+    needs sticky routing.
+    """
+
+    async def events():
+        async for event in project.generation_events_service.subscribe(generation_id):
+            if event is None:
+                yield ": keepalive\n\n"
+            else:
+                yield f"event: {event.event}\ndata: {event.model_dump_json()}\n\n"
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.websocket("/generate-image/{generation_id}/ws")
+async def api_ws_generation_events(websocket: WebSocket, generation_id: str) -> None:
+    """
+    Streams the progress of a generation over a WebSocket until it is done.
+
+    The id comes from POST /generate-image/ids, and the stream may be opened before the generation
+    request is sent. Generations are only visible to workers on the host that runs them, so this
+    needs sticky routing.
+    """
+    await websocket.accept()
+    try:
+        async for event in project.generation_events_service.subscribe(generation_id):
+            if event is None:
+                await websocket.send_text('{"event": "keepalive"}')
+            else:
+                await websocket.send_text(event.model_dump_json())
+    except WebSocketDisconnect:
+        return
+    await websocket.close()
+
+
 @app.put(
     "/user/profile",
     response_model=project.update_user_profile_service.UserProfileUpdateResponse,
 )
 async def api_put_update_user_profile(
+    user_id: str,
     first_name: Optional[str],
     last_name: Optional[str],
     email: Optional[str],
@@ -145,7 +321,7 @@ async def api_put_update_user_profile(
     """
     try:
         res = await project.update_user_profile_service.update_user_profile(
-            first_name, last_name, email, preferences
+            user_id, first_name, last_name, email, preferences
         )
         return res
     except Exception as e:
@@ -164,16 +340,43 @@ async def api_put_update_user_profile(
     response_model=project.api_generate_image_service.GenerateImageResponse,
 )
 async def api_post_api_generate_image(
-    user_id: str, text_description: str, style: Optional[str], language: Optional[str]
+    user_id: str,
+    text_description: str,
+    style: Optional[str],
+    language: Optional[str],
+    idempotency_key: Optional[str] = Header(None),
 ) -> project.api_generate_image_service.GenerateImageResponse | Response:
     """
     Endpoint for external services to generate images based on text input.
     """
     try:
-        res = await project.api_generate_image_service.api_generate_image(
-            user_id, text_description, style, language
+        res = await project.idempotency_service.run_idempotent(
+            idempotency_key,
+            "POST /api/generate-image",
+            {
+                "user_id": user_id,
+                "text_description": text_description,
+                "style": style,
+                "language": language,
+            },
+            project.api_generate_image_service.GenerateImageResponse,
+            lambda: project.api_generate_image_service.api_generate_image(
+                user_id, text_description, style, language
+            ),
         )
         return res
+    except project.idempotency_service.IdempotencyKeyMismatchError as e:
+        return Response(
+            content=json.dumps({"error": str(e)}),
+            status_code=422,
+            media_type="application/json",
+        )
+    except project.idempotency_service.IdempotencyKeyInProgressError as e:
+        return Response(
+            content=json.dumps({"error": str(e)}),
+            status_code=409,
+            media_type="application/json",
+        )
     except Exception as e:
         logger.exception("Error processing request")
         res = dict()
@@ -187,16 +390,78 @@ async def api_post_api_generate_image(
 
 @app.post("/user", response_model=project.create_user_service.CreateUserResponse)
 async def api_post_create_user(
-    email: str, password: str, first_name: Optional[str], last_name: Optional[str]
+    email: str,
+    password: str,
+    first_name: Optional[str],
+    last_name: Optional[str],
+    idempotency_key: Optional[str] = Header(None),
 ) -> project.create_user_service.CreateUserResponse | Response:
     """
     Registers a new user account on the platform.
     """
     try:
-        res = await project.create_user_service.create_user(
-            email, password, first_name, last_name
+        # The password is left out of the fingerprint so no digest of it is stored.
+        res = await project.idempotency_service.run_idempotent(
+            idempotency_key,
+            "POST /user",
+            {"email": email, "first_name": first_name, "last_name": last_name},
+            project.create_user_service.CreateUserResponse,
+            lambda: project.create_user_service.create_user(
+                email, password, first_name, last_name
+            ),
         )
         return res
+    except project.idempotency_service.IdempotencyKeyMismatchError as e:
+        return Response(
+            content=json.dumps({"error": str(e)}),
+            status_code=422,
+            media_type="application/json",
+        )
+    except project.idempotency_service.IdempotencyKeyInProgressError as e:
+        return Response(
+            content=json.dumps({"error": str(e)}),
+            status_code=409,
+            media_type="application/json",
+        )
+    except Exception as e:
+        logger.exception("Error processing request")
+        res = dict()
+        res["error"] = str(e)
+        return Response(
+            content=jsonable_encoder(res),
+            status_code=500,
+            media_type="application/json",
+        )
+
+
+@app.post("/users/bulk", response_class=StreamingResponse)
+async def api_post_bulk_create_users(request: Request) -> StreamingResponse:
+    """
+    Registers many user accounts from a streamed NDJSON or CSV upload, returning an NDJSON status per row.
+    """
+
+    async def statuses():
+        try:
+            async for status in project.bulk_create_users_service.bulk_create_users(
+                request.stream(), request.headers.get("content-type", "")
+            ):
+                yield status.model_dump_json() + "\n"
+        except ClientDisconnect:
+            return
+
+    return UploadStreamingResponse(statuses(), media_type="application/x-ndjson")
+
+
+@app.get("/users/{id}/export", response_class=StreamingResponse, response_model=None)
+async def api_get_export_user_data(
+    id: str, format: project.export_user_data_service.ExportFormat = "ndjson"
+) -> StreamingResponse | Response:
+    """
+    Streams a full export of a user's data as NDJSON, gzip-compressed NDJSON, or a zip bundle with image blobs.
+    """
+    try:
+        media_type, extension = project.export_user_data_service.EXPORT_FORMATS[format]
+        await project.export_user_data_service.ensure_user_exists(id)
     except Exception as e:
         logger.exception("Error processing request")
         res = dict()
@@ -206,6 +471,13 @@ async def api_post_create_user(
             status_code=500,
             media_type="application/json",
         )
+    return StreamingResponse(
+        project.export_user_data_service.export_user_data(id, format),
+        media_type=media_type,
+        headers={
+            "Content-Disposition": f'attachment; filename="export-{id}.{extension}"'
+        },
+    )
 
 
 @app.post("/login", response_model=project.login_user_service.LoginResponse)
@@ -274,3 +546,26 @@ async def api_post_create_style(
             status_code=500,
             media_type="application/json",
         )
+
+
+@app.get("/health/live", response_model=project.warmup_service.HealthResponse)
+async def api_get_liveness() -> project.warmup_service.HealthResponse:
+    """
+    Liveness probe. Always healthy while the process can serve requests; warmup is reported but not required.
+    """
+    return project.warmup_service.health()
+
+
+@app.get("/health/ready", response_model=project.warmup_service.HealthResponse)
+async def api_get_readiness() -> project.warmup_service.HealthResponse | Response:
+    """
+    Readiness probe. Reports healthy only after the connection pool is warm and hot data is loaded.
+    """
+    res = project.warmup_service.health()
+    if not res.warmup.ready:
+        return Response(
+            content=res.model_dump_json(),
+            status_code=503,
+            media_type="application/json",
+        )
+    return res
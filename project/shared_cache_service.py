@@ -0,0 +1,259 @@
+import fcntl
+import hashlib
+import logging
+import mmap
+import os
+import struct
+import tempfile
+import time
+from contextlib import contextmanager
+from typing import Iterator, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+SHARED_CACHE_PATH = os.getenv(
+    "SHARED_CACHE_PATH",
+    os.path.join(
+        "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir(),
+        "image-maker-cache",
+    ),
+)
+
+SHARED_CACHE_SLOTS = int(os.getenv("SHARED_CACHE_SLOTS", "4096"))
+
+SHARED_CACHE_SLOT_SIZE = int(os.getenv("SHARED_CACHE_SLOT_SIZE", "16384"))
+
+SHARED_CACHE_WAYS = 8
+
+_MAGIC = b"IMGCACHE"
+
+_VERSION = 1
+
+# magic, version, slots, slot size, ways
+_HEADER = struct.Struct("<8sIIII")
+
+_HEADER_SIZE = 64
+
+# seq, expires at, last accessed at, key hash, key length, value length
+_SLOT = struct.Struct("<QddQII")
+
+_SEQ = struct.Struct("<Q")
+
+_ACCESSED = struct.Struct("<d")
+
+_ACCESSED_OFFSET = 16
+
+_READ_ATTEMPTS = 4
+
+# Kinds of keys (the part before the first ":") already reported as too large for a slot.
+_oversized_kinds: Set[str] = set()
+
+
+def _hash_key(key: bytes) -> int:
+    return int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(), "little")
+
+
+class SharedCache:
+    """
+    A fixed-size key/value cache kept in a memory-mapped file shared by every worker on the host.
+
+    The file is split into slots grouped in buckets of SHARED_CACHE_WAYS; a key can only live in
+    the bucket its hash selects, and a full bucket evicts its least recently read slot. Each slot
+    carries a sequence number that writers make odd while they modify it, so readers never take a
+    lock: they copy the slot and retry if the sequence changed underneath them. Writers are
+    serialised across processes with an flock on the file.
+    """
+
+    def __init__(self, path: str, slots: int, slot_size: int, ways: int):
+        self.slots = slots - slots % ways
+        self.slot_size = slot_size
+        self.ways = ways
+        size = _HEADER_SIZE + self.slots * slot_size
+        header = _HEADER.pack(_MAGIC, _VERSION, self.slots, slot_size, ways)
+        # The layout is part of the file name, so workers started with different settings
+        # (e.g. during a rolling deploy) use separate files instead of resizing a shared one
+        # under each other's mappings.
+        self.path = f"{path}-v{_VERSION}-{self.slots}x{slot_size}x{ways}"
+        self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        with self._locked():
+            if os.fstat(self._fd).st_size == 0:
+                os.ftruncate(self._fd, size)
+                os.pwrite(self._fd, header, 0)
+            valid = os.pread(self._fd, _HEADER.size, 0) == header
+        if not valid:
+            os.close(self._fd)
+            raise RuntimeError(
+                f"Shared cache file {self.path} has an unexpected layout; remove it."
+            )
+        self._mm = mmap.mmap(self._fd, size)
+
+    @contextmanager
+    def _locked(self) -> Iterator[None]:
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def _bucket(self, key_hash: int) -> range:
+        first = (key_hash % (self.slots // self.ways)) * self.ways
+        return range(first, first + self.ways)
+
+    def _offset(self, slot: int) -> int:
+        return _HEADER_SIZE + slot * self.slot_size
+
+    def _read(self, offset: int, key: bytes, key_hash: int) -> Optional[bytes]:
+        for _ in range(_READ_ATTEMPTS):
+            seq, expires_at, _, slot_hash, key_len, value_len = _SLOT.unpack_from(
+                self._mm, offset
+            )
+            if seq & 1:
+                continue
+            if slot_hash != key_hash or key_len != len(key):
+                return None
+            start = offset + _SLOT.size
+            data = self._mm[start : start + key_len + value_len]
+            if _SEQ.unpack_from(self._mm, offset)[0] != seq:
+                continue
+            if data[:key_len] != key or expires_at <= time.time():
+                return None
+            return data[key_len:]
+        return None
+
+    def _write(
+        self, offset: int, key_hash: int, expires_at: float, key: bytes, value: bytes
+    ) -> None:
+        seq = _SEQ.unpack_from(self._mm, offset)[0]
+        _SEQ.pack_into(self._mm, offset, seq + 1)
+        start = offset + _SLOT.size
+        self._mm[start : start + len(key) + len(value)] = key + value
+        _SLOT.pack_into(
+            self._mm,
+            offset,
+            seq + 1,
+            expires_at,
+            time.time(),
+            key_hash,
+            len(key),
+            len(value),
+        )
+        _SEQ.pack_into(self._mm, offset, seq + 2)
+
+    def get(self, key: str) -> Optional[bytes]:
+        encoded = key.encode("utf-8")
+        key_hash = _hash_key(encoded)
+        for slot in self._bucket(key_hash):
+            offset = self._offset(slot)
+            value = self._read(offset, encoded, key_hash)
+            if value is not None:
+                _ACCESSED.pack_into(self._mm, offset + _ACCESSED_OFFSET, time.time())
+                return value
+        return None
+
+    def set(self, key: str, value: bytes, ttl: float) -> bool:
+        encoded = key.encode("utf-8")
+        if _SLOT.size + len(encoded) + len(value) > self.slot_size:
+            kind = key.split(":", 1)[0]
+            logger.log(
+                logging.DEBUG if kind in _oversized_kinds else logging.WARNING,
+                "Shared cache value for %r is %d bytes and does not fit a %d byte slot; "
+                "raise SHARED_CACHE_SLOT_SIZE to cache it",
+                key,
+                len(value),
+                self.slot_size,
+            )
+            _oversized_kinds.add(kind)
+            # Never leave an older value behind for a key whose new value was not stored.
+            self.delete(key)
+            return False
+        key_hash = _hash_key(encoded)
+        now = time.time()
+        with self._locked():
+            victim, victim_rank = None, None
+            for slot in self._bucket(key_hash):
+                offset = self._offset(slot)
+                _, expires_at, accessed_at, slot_hash, key_len, _ = _SLOT.unpack_from(
+                    self._mm, offset
+                )
+                start = offset + _SLOT.size
+                if (
+                    slot_hash == key_hash
+                    and key_len == len(encoded)
+                    and self._mm[start : start + key_len] == encoded
+                ):
+                    victim = offset
+                    break
+                # Empty and expired slots are reused before evicting the least recently read one.
+                rank = -1.0 if key_len == 0 or expires_at <= now else accessed_at
+                if victim_rank is None or rank < victim_rank:
+                    victim, victim_rank = offset, rank
+            self._write(victim, key_hash, now + ttl, encoded, value)
+        return True
+
+    def delete(self, key: str) -> None:
+        encoded = key.encode("utf-8")
+        key_hash = _hash_key(encoded)
+        if all(
+            self._read(self._offset(slot), encoded, key_hash) is None
+            for slot in self._bucket(key_hash)
+        ):
+            return
+        with self._locked():
+            for slot in self._bucket(key_hash):
+                offset = self._offset(slot)
+                if self._read(offset, encoded, key_hash) is not None:
+                    self._write(offset, 0, 0.0, b"", b"")
+
+
+_cache: Optional[SharedCache] = None
+
+
+def _get_cache() -> SharedCache:
+    global _cache
+    if _cache is None:
+        _cache = SharedCache(
+            SHARED_CACHE_PATH,
+            SHARED_CACHE_SLOTS,
+            SHARED_CACHE_SLOT_SIZE,
+            SHARED_CACHE_WAYS,
+        )
+    return _cache
+
+
+def get(key: str) -> Optional[bytes]:
+    """
+    Reads a value from the host-wide shared cache without taking a lock.
+
+    Args:
+        key (str): The cache key.
+
+    Returns:
+        Optional[bytes]: The cached value, or None if it is missing or has expired.
+    """
+    return _get_cache().get(key)
+
+
+def set(key: str, value: bytes, ttl: float) -> bool:
+    """
+    Stores a value in the host-wide shared cache, evicting the least recently read entry of its bucket if needed.
+
+    Args:
+        key (str): The cache key.
+        value (bytes): The value to store.
+        ttl (float): How many seconds the value stays valid.
+
+    Returns:
+        bool: False if the key and value do not fit in a slot, which is logged; any older value for
+            the key is removed.
+    """
+    return _get_cache().set(key, value, ttl)
+
+
+def delete(key: str) -> None:
+    """
+    Removes a value from the host-wide shared cache, for every worker.
+
+    Args:
+        key (str): The cache key.
+    """
+    _get_cache().delete(key)
@@ -2,6 +2,8 @@ from typing import Optional
 
 import prisma
 import prisma.models
+import project.login_user_service
+import project.profile_cache_service
 from pydantic import BaseModel
 
 
@@ -24,6 +26,7 @@ class UserProfileUpdateResponse(BaseModel):
 
 
 async def update_user_profile(
+    user_id: str,
     first_name: Optional[str],
     last_name: Optional[str],
     email: Optional[str],
@@ -32,7 +35,11 @@ async def update_user_profile(
     """
     Allows users to update their profile information.
 
+    The email check and all updates run in a single transaction. Once it commits, the new
+    values are written through to the profile cache so later reads see them immediately.
+
     Args:
+        user_id (str): The unique identifier of the user whose profile is being updated.
         first_name (Optional[str]): The user's first name.
         last_name (Optional[str]): The user's last name.
         email (Optional[str]): The user's email. Must be unique across the system.
@@ -43,6 +50,7 @@ async def update_user_profile(
 
     Example:
         await update_user_profile(
+            user_id='1b6c0e6e-0a4b-4c5e-9f3c-2d5e8b7a9f10',
             first_name='John',
             last_name='Doe',
             email='john.doe@example.com',
@@ -51,25 +59,65 @@ async def update_user_profile(
         > UserProfileUpdateResponse(success=True, message='User profile updated successfully.')
     """
     try:
-        if email:
-            user = await prisma.models.User.prisma().find_unique(where={"email": email})
-            if user:
+        async with prisma.get_client().tx() as tx:
+            if email:
+                user = await prisma.models.User.prisma(tx).find_unique(
+                    where={"email": email}
+                )
+                if user and user.id != user_id:
+                    return UserProfileUpdateResponse(
+                        success=False, message="Email already exists."
+                    )
+            profile_data = {"firstName": first_name, "lastName": last_name}
+            user_data = {
+                "Profile": {"upsert": {"create": profile_data, "update": profile_data}}
+            }
+            previous_email = None
+            if email:
+                user_data["email"] = email
+                current = await prisma.models.User.prisma(tx).find_unique(
+                    where={"id": user_id}
+                )
+                if current is not None and current.email != email:
+                    previous_email = current.email
+            user = await prisma.models.User.prisma(tx).update(
+                where={"id": user_id}, data=user_data
+            )
+            if user is None:
                 return UserProfileUpdateResponse(
-                    success=False, message="Email already exists."
+                    success=False, message="User not found."
                 )
-        current_user_id = "current_user_id_placeholder"
-        await prisma.models.Profile.prisma().update(
-            where={"userId": current_user_id},
-            data={"firstName": first_name, "lastName": last_name},
-        )
-        await prisma.models.UserPreferences.prisma().update_many(
-            where={"userId": current_user_id},
-            data={"theme": preferences.theme, "language": preferences.language},
+            preference_data = {"theme": preferences.theme}
+            if preferences.language:
+                preference_data["language"] = preferences.language
+            existing_preferences = await prisma.models.UserPreferences.prisma(
+                tx
+            ).find_first(where={"userId": user_id})
+            if existing_preferences is None:
+                saved_preferences = await prisma.models.UserPreferences.prisma(
+                    tx
+                ).create(data={"userId": user_id, **preference_data})
+            else:
+                saved_preferences = await prisma.models.UserPreferences.prisma(
+                    tx
+                ).update(where={"id": existing_preferences.id}, data=preference_data)
+        if previous_email is not None:
+            project.login_user_service.invalidate_login_credentials(previous_email)
+        project.profile_cache_service.store_user_profile(
+            project.profile_cache_service.CachedUserProfile(
+                user_id=user.id,
+                email=user.email,
+                first_name=first_name,
+                last_name=last_name,
+                theme=saved_preferences.theme,
+                language=saved_preferences.language,
+            )
         )
         return UserProfileUpdateResponse(
             success=True, message="User profile updated successfully."
         )
     except Exception as e:
+        project.profile_cache_service.invalidate_user_profile(user_id)
         return UserProfileUpdateResponse(
             success=False, message=f"Failed to update user profile. Error: {str(e)}"
         )
@@ -0,0 +1,104 @@
+import asyncio
+import logging
+import os
+import time
+
+import prisma
+import project.list_styles_service
+from pydantic import BaseModel
+
+logger = logging.getLogger(__name__)
+
+DB_POOL_WARM_SIZE = int(os.getenv("DB_POOL_WARM_SIZE", "5"))
+
+
+class WarmupReport(BaseModel):
+    """
+    Timings and counts collected while the server was starting up.
+    """
+
+    import_seconds: float = 0.0
+    connect_seconds: float = 0.0
+    pool_warm_seconds: float = 0.0
+    preload_seconds: float = 0.0
+    pool_size: int = 0
+    styles_loaded: int = 0
+    ready: bool = False
+
+
+class HealthResponse(BaseModel):
+    """
+    The health status reported to liveness and readiness probes.
+    """
+
+    status: str
+    warmup: WarmupReport
+
+
+report = WarmupReport()
+
+
+async def warm_connection_pool(db: prisma.Prisma, size: int) -> None:
+    """
+    Opens database connections ahead of traffic by running trivial queries concurrently.
+
+    Args:
+        db (prisma.Prisma): The connected Prisma client.
+        size (int): The number of connections to establish, normally the configured pool size.
+    """
+    await asyncio.gather(*(db.query_raw("SELECT 1") for _ in range(size)))
+
+
+async def run_warmup(db: prisma.Prisma, import_seconds: float) -> WarmupReport:
+    """
+    Connects to the database, warms the connection pool and pre-loads the style catalog.
+
+    The server only reports itself ready once this has completed, so new instances do
+    not take traffic while their caches and connections are still cold.
+
+    Args:
+        db (prisma.Prisma): The Prisma client used by the server.
+        import_seconds (float): How long importing the application modules took.
+
+    Returns:
+        WarmupReport: Timings and counts collected during startup.
+    """
+    report.ready = False
+    report.import_seconds = import_seconds
+
+    started = time.perf_counter()
+    await db.connect()
+    report.connect_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    await warm_connection_pool(db, DB_POOL_WARM_SIZE)
+    report.pool_warm_seconds = time.perf_counter() - started
+    report.pool_size = DB_POOL_WARM_SIZE
+
+    started = time.perf_counter()
+    styles = await project.list_styles_service.load_styles()
+    report.styles_loaded = len(styles.styles)
+    report.preload_seconds = time.perf_counter() - started
+
+    report.ready = True
+    logger.info(
+        "Warmup finished: imports %.3fs, connect %.3fs, pool of %d warmed in %.3fs, "
+        "preloaded %d styles in %.3fs",
+        report.import_seconds,
+        report.connect_seconds,
+        report.pool_size,
+        report.pool_warm_seconds,
+        report.styles_loaded,
+        report.preload_seconds,
+    )
+    return report
+
+
+def health() -> HealthResponse:
+    """
+    Reports whether the server has finished warming up.
+
+    Returns:
+        HealthResponse: "ok" once warmup has finished, "starting" before that.
+    """
+    return HealthResponse(status="ok" if report.ready else "starting", warmup=report)
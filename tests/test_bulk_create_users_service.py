@@ -0,0 +1,74 @@
+import asyncio
+from typing import AsyncIterator, List, Tuple
+
+import pytest
+from project import bulk_create_users_service
+from project.bulk_create_users_service import BulkUserRow, BulkUserRowStatus
+
+
+async def _chunks(data: bytes, size: int) -> AsyncIterator[bytes]:
+    for start in range(0, len(data), size):
+        yield data[start : start + size]
+
+
+def _rows(
+    data: bytes, content_type: str = "text/csv", size: int = 7
+) -> List[Tuple[int, BulkUserRow | BulkUserRowStatus]]:
+    async def collect():
+        return [
+            item
+            async for item in bulk_create_users_service._iter_rows(
+                _chunks(data, size), content_type
+            )
+        ]
+
+    return asyncio.run(collect())
+
+
+def _failed(item: BulkUserRow | BulkUserRowStatus) -> bool:
+    return isinstance(item, BulkUserRowStatus) and not item.success
+
+
+def test_csv_quoted_fields_may_contain_commas_quotes_and_newlines():
+    rows = _rows(
+        b"email,password,first_name\r\n"
+        b'a@x.com,p1,"Smith, Jo"\r\n'
+        b"\r\n"
+        b'b@x.com,p2,"two\nlines ""quoted"""\n'
+    )
+    assert [row for row, _ in rows] == [1, 2]
+    assert rows[0][1].first_name == "Smith, Jo"
+    assert rows[1][1].first_name == 'two\nlines "quoted"'
+
+
+def test_csv_unterminated_quote_at_end_of_upload_fails_its_row():
+    rows = _rows(b'email,password\n"a@x.com,pw\nb@x.com,pw\n')
+    assert len(rows) == 1
+    assert rows[0][0] == 1 and _failed(rows[0][1])
+
+
+def test_csv_row_with_extra_fields_is_rejected():
+    rows = _rows(b"email,password\na@x.com,pw,surplus\nb@x.com,pw\n")
+    assert _failed(rows[0][1])
+    assert rows[1][1].email == "b@x.com"
+
+
+def test_over_long_line_fails_only_its_row(monkeypatch):
+    monkeypatch.setattr(bulk_create_users_service, "BULK_IMPORT_MAX_LINE_BYTES", 40)
+    rows = _rows(b"email,password\na@x.com," + b"p" * 100 + b"\nb@x.com,pw\n")
+    assert [row for row, _ in rows] == [1, 2]
+    assert _failed(rows[0][1])
+    assert rows[1][1].email == "b@x.com"
+
+
+@pytest.mark.parametrize("content_type", ["text/csv", "application/x-ndjson"])
+def test_invalid_utf8_fails_only_its_row(content_type):
+    if content_type == "text/csv":
+        data = b"email,password\na@x.com,\xff\xfe\nb@x.com,pw\n"
+    else:
+        data = b'{"email": "a@x.com", "password": "\xff"}\n'
+        data += b'{"email": "b@x.com", "password": "pw"}\n'
+    rows = _rows(data, content_type)
+    assert [row for row, _ in rows] == [1, 2]
+    assert _failed(rows[0][1])
+    assert rows[1][1].email == "b@x.com"
@@ -0,0 +1,85 @@
+import asyncio
+from typing import List, Optional
+
+import pytest
+from project import generation_events_service, shared_cache_service
+from project.generation_events_service import GenerationEvent
+
+
+@pytest.fixture(autouse=True)
+def isolated(monkeypatch, tmp_path):
+    monkeypatch.setattr(
+        shared_cache_service,
+        "_cache",
+        shared_cache_service.SharedCache(
+            str(tmp_path / "cache"), slots=64, slot_size=4096, ways=8
+        ),
+    )
+    monkeypatch.setattr(generation_events_service, "_latest", {})
+    monkeypatch.setattr(generation_events_service, "_subscribers", {})
+    monkeypatch.setattr(
+        generation_events_service, "GENERATION_EVENTS_POLL_SECONDS", 0.01
+    )
+    monkeypatch.setattr(
+        generation_events_service, "GENERATION_EVENTS_FIRST_EVENT_SECONDS", 2.0
+    )
+
+
+async def _collect(generation_id: str) -> List[Optional[str]]:
+    return [
+        event.event if event is not None else None
+        async for event in generation_events_service.subscribe(generation_id)
+    ]
+
+
+def _event(generation_id: str, event: str) -> GenerationEvent:
+    return GenerationEvent(generation_id=generation_id, event=event)
+
+
+def test_issued_ids_belong_to_their_user():
+    issued = generation_events_service.issue_generation_id("user-1").generation_id
+    other = generation_events_service.issue_generation_id("user-1").generation_id
+    assert issued != other
+    assert generation_events_service.generation_id_owner(issued) == "user-1"
+    assert generation_events_service.generation_id_owner("made-up") is None
+
+
+def test_subscriber_waits_for_a_generation_that_has_not_started():
+    generation_id = generation_events_service.issue_generation_id("u").generation_id
+
+    async def scenario():
+        subscriber = asyncio.create_task(_collect(generation_id))
+        await asyncio.sleep(0.1)
+        generation_events_service.publish(_event(generation_id, "queued"))
+        await asyncio.sleep(0.05)
+        generation_events_service.publish(_event(generation_id, "done"))
+        return await asyncio.wait_for(subscriber, 1)
+
+    assert asyncio.run(scenario()) == ["queued", "done"]
+
+
+def test_subscriber_gives_up_on_a_generation_that_never_starts(monkeypatch):
+    monkeypatch.setattr(
+        generation_events_service, "GENERATION_EVENTS_FIRST_EVENT_SECONDS", 0.05
+    )
+    generation_id = generation_events_service.issue_generation_id("u").generation_id
+    assert asyncio.run(asyncio.wait_for(_collect(generation_id), 1)) == []
+
+
+def test_unissued_id_ends_at_once():
+    assert asyncio.run(asyncio.wait_for(_collect("made-up"), 0.5)) == []
+
+
+def test_generation_in_another_worker_is_followed_through_the_shared_cache():
+    generation_id = generation_events_service.issue_generation_id("u").generation_id
+
+    async def scenario():
+        subscriber = asyncio.create_task(_collect(generation_id))
+        for event in ("started", "done"):
+            await asyncio.sleep(0.05)
+            generation_events_service.publish(_event(generation_id, event))
+            # Forget it locally, as if it had been published by another worker.
+            generation_events_service._latest.clear()
+        return await asyncio.wait_for(subscriber, 1)
+
+    assert asyncio.run(scenario()) == ["started", "done"]
@@ -0,0 +1,160 @@
+import asyncio
+import gc
+from typing import List, Optional
+
+import pytest
+from project import generation_router_service
+from project.generation_router_service import (
+    CircuitBreaker,
+    FakeGenerationBackend,
+    GenerationRouter,
+)
+
+
+class GatedBackend:
+    """
+    Answers, or fails, once its gate opens.
+    """
+
+    def __init__(self, name: str, gate: asyncio.Event, fail: bool = False):
+        self.name = name
+        self.gate = gate
+        self.fail = fail
+        self.calls = 0
+
+    async def generate(
+        self, text_description: str, style: Optional[str], language: Optional[str]
+    ) -> str:
+        self.calls += 1
+        await self.gate.wait()
+        if self.fail:
+            raise Exception(f"Backend {self.name} failed to generate the image")
+        return f"https://example.com/{self.name}.jpg"
+
+
+@pytest.fixture(autouse=True)
+def breaker_settings(monkeypatch):
+    monkeypatch.setattr(generation_router_service, "GENERATION_STATS_MIN_SAMPLES", 2)
+    monkeypatch.setattr(
+        generation_router_service, "GENERATION_BREAKER_ERROR_RATE", 0.5
+    )
+    monkeypatch.setattr(
+        generation_router_service, "GENERATION_BREAKER_COOLDOWN_SECONDS", 0.05
+    )
+
+
+def _with_fast_history(router: GenerationRouter, name: str) -> None:
+    for _ in range(2):
+        router.breakers[name].record(0.01, True)
+
+
+def test_failed_backend_fails_over_to_the_next():
+    router = GenerationRouter(
+        [
+            FakeGenerationBackend("broken", 0, 1.0),
+            FakeGenerationBackend("healthy", 0, 0.0),
+        ],
+        hedging=False,
+    )
+    result = asyncio.run(router.generate("a cat"))
+    assert result.backend == "healthy"
+    assert router.breakers["broken"].samples[-1][1] is False
+
+
+def test_slow_backend_is_hedged_and_the_loser_cancelled():
+    async def scenario():
+        slow = GatedBackend("slow", asyncio.Event())
+        fast_gate = asyncio.Event()
+        fast_gate.set()
+        router = GenerationRouter(
+            [slow, GatedBackend("fast", fast_gate)], hedging=True
+        )
+        _with_fast_history(router, "slow")
+        result = await asyncio.wait_for(router.generate("a cat"), 1)
+        await asyncio.sleep(0)
+        return router, result
+
+    router, result = asyncio.run(scenario())
+    assert result.backend == "fast"
+    # The cancelled call is neither a success nor a failure of the slow backend.
+    assert len(router.breakers["slow"].samples) == 2
+    assert router.breakers["slow"].probing is False
+
+
+def test_failure_finishing_with_the_winner_is_retrieved(monkeypatch):
+    errors: List[dict] = []
+    wait = asyncio.wait
+
+    async def hedge_first(tasks, **kwargs):
+        # Set order is arbitrary. Put the winning hedge, the last task launched, first: the
+        # order that used to leave the failure unretrieved.
+        done, pending = await wait(tasks, **kwargs)
+        return sorted(done, key=lambda task: -int(task.get_name().split("-")[1])), pending
+
+    async def scenario():
+        asyncio.get_running_loop().set_exception_handler(
+            lambda loop, context: errors.append(context)
+        )
+        gate = asyncio.Event()
+        router = GenerationRouter(
+            [GatedBackend("failing", gate, fail=True), GatedBackend("winner", gate)],
+            hedging=True,
+        )
+        _with_fast_history(router, "failing")
+        monkeypatch.setattr(asyncio, "wait", hedge_first)
+        call = asyncio.create_task(router.generate("a cat"))
+        await asyncio.sleep(0.05)
+        gate.set()
+        result = await asyncio.wait_for(call, 1)
+        gc.collect()
+        return result
+
+    assert asyncio.run(scenario()).backend == "winner"
+    assert errors == []
+
+
+def test_breaker_opens_half_opens_for_one_probe_and_closes():
+    breaker = CircuitBreaker()
+    breaker.record(0.1, False)
+    breaker.record(0.1, False)
+    assert breaker.state == "open"
+    assert not breaker.acquire()
+    asyncio.run(asyncio.sleep(0.06))
+    assert breaker.acquire()
+    assert breaker.state == "half-open"
+    assert not breaker.acquire()
+    breaker.record(0.1, True)
+    assert breaker.state == "closed"
+    assert breaker.acquire()
+
+
+def test_failed_probe_reopens_the_breaker():
+    breaker = CircuitBreaker()
+    breaker.record(0.1, False)
+    breaker.record(0.1, False)
+    asyncio.run(asyncio.sleep(0.06))
+    assert breaker.acquire()
+    breaker.record(0.1, False)
+    assert breaker.state == "open"
+    assert not breaker.acquire()
+
+
+def test_cancelled_probe_releases_its_slot():
+    async def scenario():
+        backend = GatedBackend("recovering", asyncio.Event())
+        router = GenerationRouter([backend], hedging=False)
+        breaker = router.breakers["recovering"]
+        breaker.record(0.1, False)
+        breaker.record(0.1, False)
+        await asyncio.sleep(0.06)
+        call = asyncio.create_task(router.generate("a cat"))
+        await asyncio.sleep(0.01)
+        assert breaker.probing
+        call.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await call
+        return breaker
+
+    breaker = asyncio.run(scenario())
+    assert breaker.probing is False
+    assert breaker.acquire()
@@ -0,0 +1,93 @@
+import asyncio
+from typing import List
+
+import pytest
+from project import idempotency_service
+from pydantic import BaseModel
+
+
+class Echo(BaseModel):
+    value: str
+
+
+@pytest.fixture
+def purges(monkeypatch) -> List[int]:
+    calls: List[int] = []
+
+    async def purge_expired_records() -> int:
+        calls.append(1)
+        return 0
+
+    async def claim(key, record_key, hashed, response_model):
+        return None
+
+    async def noop(*args):
+        return None
+
+    monkeypatch.setattr(idempotency_service, "_in_flight", {})
+    monkeypatch.setattr(idempotency_service, "_purged_at", None)
+    monkeypatch.setattr(idempotency_service, "_claim_or_wait", claim)
+    monkeypatch.setattr(idempotency_service, "_complete", noop)
+    monkeypatch.setattr(idempotency_service, "_release", noop)
+    monkeypatch.setattr(idempotency_service, "_remember", lambda *args: None)
+    monkeypatch.setattr(idempotency_service, "_recall", lambda *args: None)
+    monkeypatch.setattr(
+        idempotency_service, "purge_expired_records", purge_expired_records
+    )
+    return calls
+
+
+def _run(handler):
+    return idempotency_service.run_idempotent(
+        "key", "POST /test", {"a": 1}, Echo, handler
+    )
+
+
+def test_retry_takes_over_when_the_original_request_is_cancelled(purges):
+    runs: List[str] = []
+
+    async def handler(name: str) -> Echo:
+        runs.append(name)
+        await asyncio.sleep(0.1 if name == "original" else 0)
+        return Echo(value=name)
+
+    async def scenario():
+        original = asyncio.create_task(_run(lambda: handler("original")))
+        await asyncio.sleep(0.01)
+        retry = asyncio.create_task(_run(lambda: handler("retry")))
+        await asyncio.sleep(0.01)
+        original.cancel()
+        return await asyncio.wait_for(retry, 1)
+
+    assert asyncio.run(scenario()) == Echo(value="retry")
+    assert runs == ["original", "retry"]
+
+
+def test_waiting_retry_shares_the_original_response(purges):
+    runs: List[str] = []
+
+    async def handler(name: str) -> Echo:
+        runs.append(name)
+        await asyncio.sleep(0.05)
+        return Echo(value=name)
+
+    async def scenario():
+        return await asyncio.gather(
+            _run(lambda: handler("original")), _run(lambda: handler("retry"))
+        )
+
+    assert asyncio.run(scenario()) == [Echo(value="original")] * 2
+    assert runs == ["original"]
+
+
+def test_expired_records_are_purged_once_per_interval(purges):
+    async def handler() -> Echo:
+        return Echo(value="ok")
+
+    async def scenario():
+        for _ in range(3):
+            await _run(handler)
+        await asyncio.sleep(0)
+
+    asyncio.run(scenario())
+    assert len(purges) == 1
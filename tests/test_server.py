@@ -0,0 +1,94 @@
+import json
+from typing import Dict, List
+
+import project.bulk_create_users_service
+import project.generate_image_service
+import project.generation_events_service
+import project.server
+import pytest
+from fastapi.testclient import TestClient
+from project.bulk_create_users_service import BulkUserRow, BulkUserRowStatus
+
+
+@pytest.fixture
+def client():
+    # Used without a with-block, so the lifespan does not connect to the database.
+    return TestClient(project.server.app)
+
+
+@pytest.fixture
+def imported(monkeypatch) -> List[str]:
+    emails: List[str] = []
+
+    async def import_batch(batch: Dict[int, BulkUserRow]) -> List[BulkUserRowStatus]:
+        emails.extend(user.email for user in batch.values())
+        return [
+            BulkUserRowStatus(
+                row=row, success=True, message="created", email=user.email
+            )
+            for row, user in batch.items()
+        ]
+
+    monkeypatch.setattr(
+        project.bulk_create_users_service, "_import_batch", import_batch
+    )
+    return emails
+
+
+@pytest.mark.parametrize("rows", [1, 2000])
+def test_bulk_create_users_reads_the_whole_upload(client, imported, rows):
+    body = "".join(
+        json.dumps({"email": f"user{i}@example.com", "password": "pw"}) + "\n"
+        for i in range(rows)
+    )
+    response = client.post(
+        "/users/bulk",
+        content=body.encode("utf-8"),
+        headers={"content-type": "application/x-ndjson"},
+    )
+    assert response.status_code == 200
+    statuses = [json.loads(line) for line in response.text.splitlines()]
+    assert [status["row"] for status in statuses] == list(range(1, rows + 1))
+    assert all(status["success"] for status in statuses)
+    assert len(imported) == rows
+
+
+@pytest.mark.parametrize("query", [{}, {"style": "", "language": ""}])
+def test_generate_image_leaves_missing_preferences_to_the_profile(
+    client, monkeypatch, query
+):
+    calls = []
+
+    async def generate_image(user_id, text_description, style, language, generation_id):
+        calls.append((style, language))
+        return project.generate_image_service.GenerateImageResponse(
+            image_url="https://example.com/image.png",
+            generation_time="2024-01-01T00:00:00",
+        )
+
+    monkeypatch.setattr(
+        project.generate_image_service, "generate_image", generate_image
+    )
+    response = client.post(
+        "/generate-image",
+        params={"user_id": "u1", "text_description": "a cat", **query},
+    )
+    assert response.status_code == 200
+    assert calls == [(None, None)]
+
+
+def test_generate_image_rejects_a_generation_id_of_another_user(client, monkeypatch):
+    monkeypatch.setattr(
+        project.generation_events_service,
+        "generation_id_owner",
+        lambda generation_id: "owner",
+    )
+    response = client.post(
+        "/generate-image",
+        params={
+            "user_id": "intruder",
+            "text_description": "a cat",
+            "generation_id": "issued-to-owner",
+        },
+    )
+    assert response.status_code == 403
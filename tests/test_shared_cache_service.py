@@ -0,0 +1,129 @@
+import logging
+import multiprocessing
+import time
+
+import pytest
+from project.shared_cache_service import _SEQ, SharedCache
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "cache")
+
+
+def _one_bucket(path: str, slot_size: int = 256) -> SharedCache:
+    return SharedCache(path, slots=2, slot_size=slot_size, ways=2)
+
+
+def test_set_get_delete(path):
+    cache = _one_bucket(path)
+    assert cache.set("a", b"1", 60)
+    assert cache.get("a") == b"1"
+    assert cache.set("a", b"2", 60)
+    assert cache.get("a") == b"2"
+    cache.delete("a")
+    assert cache.get("a") is None
+
+
+def test_workers_share_entries(path):
+    assert _one_bucket(path).set("a", b"1", 60)
+    assert _one_bucket(path).get("a") == b"1"
+
+
+def test_expired_entry_is_not_returned(path):
+    cache = _one_bucket(path)
+    cache.set("a", b"1", 0.05)
+    time.sleep(0.1)
+    assert cache.get("a") is None
+
+
+def test_expired_entry_is_reused_before_evicting(path):
+    cache = _one_bucket(path)
+    cache.set("live", b"1", 60)
+    cache.set("expiring", b"2", 0.05)
+    time.sleep(0.1)
+    cache.set("new", b"3", 60)
+    assert cache.get("live") == b"1"
+    assert cache.get("new") == b"3"
+
+
+def test_full_bucket_evicts_least_recently_read(path):
+    cache = _one_bucket(path)
+    cache.set("a", b"1", 60)
+    cache.set("b", b"2", 60)
+    assert cache.get("a") == b"1"
+    cache.set("c", b"3", 60)
+    assert cache.get("a") == b"1"
+    assert cache.get("b") is None
+    assert cache.get("c") == b"3"
+
+
+def test_oversized_value_removes_previous_entry(path):
+    cache = _one_bucket(path, slot_size=128)
+    cache.set("a", b"small", 60)
+    assert not cache.set("a", b"x" * 128, 60)
+    assert cache.get("a") is None
+
+
+def test_slot_being_written_is_not_read(path):
+    cache = _one_bucket(path)
+    cache.set("a", b"1", 60)
+    for slot in range(cache.slots):
+        offset = cache._offset(slot)
+        seq = _SEQ.unpack_from(cache._mm, offset)[0]
+        _SEQ.pack_into(cache._mm, offset, seq | 1)
+    assert cache.get("a") is None
+
+
+def _write_patterns(path: str, stop_at: float) -> None:
+    cache = _one_bucket(path, slot_size=4096)
+    fill = 0
+    while time.monotonic() < stop_at:
+        cache.set("a", bytes([fill]) * 2048, 60)
+        fill = (fill + 1) % 256
+
+
+def test_concurrent_reads_are_never_torn(path):
+    cache = _one_bucket(path, slot_size=4096)
+    cache.set("a", bytes(2048), 60)
+    stop_at = time.monotonic() + 1.0
+    writer = multiprocessing.get_context("fork").Process(
+        target=_write_patterns, args=(path, stop_at)
+    )
+    writer.start()
+    try:
+        reads = 0
+        while time.monotonic() < stop_at:
+            value = cache.get("a")
+            if value is not None:
+                assert len(value) == 2048
+                assert value == bytes([value[0]]) * 2048
+                reads += 1
+        assert reads > 0
+    finally:
+        writer.join()
+    assert writer.exitcode == 0
+
+
+def test_different_layouts_use_separate_files(path):
+    small = SharedCache(path, slots=8, slot_size=256, ways=2)
+    small.set("a", b"1", 60)
+    large = SharedCache(path, slots=8, slot_size=512, ways=2)
+    assert large.path != small.path
+    assert large.get("a") is None
+    assert small.get("a") == b"1"
+
+
+def test_unexpected_header_fails_loudly(path):
+    cache = _one_bucket(path)
+    with open(cache.path, "r+b") as file:
+        file.write(b"NOTACACHE")
+    with pytest.raises(RuntimeError):
+        _one_bucket(path)
+
+
+def test_oversized_value_is_reported(path, caplog):
+    cache = _one_bucket(path, slot_size=128)
+    with caplog.at_level(logging.WARNING, logger="project.shared_cache_service"):
+        cache.set("too-big:1", b"x" * 128, 60)
+    assert "SHARED_CACHE_SLOT_SIZE" in caplog.text